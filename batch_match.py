@@ -0,0 +1,153 @@
+import argparse
+import asyncio
+import json
+import os
+
+import numpy as np
+from rapidfuzz import process, fuzz
+
+from classes import Pinnacle, Betonline
+from clean import clean_names
+
+TEAM_NAMES_PATH = 'jsons/team_names.json'
+LEAGUE_MAP_PATH = 'league_name_map.json'
+NEW_NAME_MAP_PATH = 'jsons/new_name_map.json'
+REVIEW_PATH = 'jsons/match_review.json'
+
+
+def match_league(teams, pin_teams, accept_score=90, accept_margin=5, review_score=50, candidates=5):
+    """
+    Match one league's book team names against its Pinnacle team names in a single similarity matrix.
+
+    :param teams: Book team names still missing a mapping
+    :param pin_teams: Pinnacle team names of the same league
+    :return: (accepted, review) - accepted maps team -> Pinnacle name for matches scoring at least accept_score and
+        beating the runner-up by accept_margin; review lists the remaining teams with their best candidates
+    """
+    teams, pin_teams = list(teams), list(pin_teams)
+    if not teams or not pin_teams:
+        return {}, []
+    scores = process.cdist(clean_names(teams), clean_names(pin_teams),
+                           scorer=fuzz.token_set_ratio, workers=-1)
+
+    accepted = {}
+    review = []
+    order = np.argsort(-scores, axis=1, kind='stable')
+    for i, team in enumerate(teams):
+        ranked = order[i]
+        best = scores[i, ranked[0]]
+        runner_up = scores[i, ranked[1]] if len(ranked) > 1 else 0
+        if best >= accept_score and best - runner_up >= accept_margin:
+            accepted[team] = pin_teams[ranked[0]]
+        elif best >= review_score:
+            review.append({
+                'team': team,
+                'candidates': [[pin_teams[j], round(float(scores[i, j]), 1)] for j in ranked[:candidates]
+                               if scores[i, j] >= review_score],
+                'match': None,
+            })
+    return accepted, review
+
+
+def collect_teams(books_data, league_map, team_map):
+    """
+    Partition unmapped book teams and Pinnacle teams by Pinnacle league.
+
+    :return: {league: (unmapped book teams, Pinnacle teams)}
+    """
+    league_map = {raw.lower(): league for raw, league in league_map.items()}
+    known = {league: {team.lower() for team in names} for league, names in team_map.items()}
+    leagues = {}
+    for data, book_name in books_data:
+        if not data:
+            continue
+        for game_name, game_data in data.items():
+            try:
+                teams = game_name.title().split(' @ ')
+            except AttributeError:
+                continue
+            if book_name == 'pin':
+                league = game_data.get('info', {}).get('league')
+                if league:
+                    leagues.setdefault(league, (set(), set()))[1].update(teams)
+                continue
+            league = league_map.get(str(game_data.get('league', '')).lower())
+            if not league:
+                continue
+            unmapped = {team for team in teams if team.lower() not in known.get(league, set())}
+            leagues.setdefault(league, (set(), set()))[0].update(unmapped)
+    return {league: (sorted(teams), sorted(pin_teams)) for league, (teams, pin_teams) in leagues.items()}
+
+
+async def run_batch_match(sport, live, accept_score=90, accept_margin=5):
+    pinnacle, betonline = Pinnacle(sport), Betonline(sport)
+    books = [pinnacle, betonline]
+    # Matching only reads the feeds; Pinnacle has no database pool here
+    results = await asyncio.gather(pinnacle.get_events_data(live=live, persist=False),
+                                   betonline.get_events_data(live=live), return_exceptions=True)
+    failed = [f'{book.name}: {result!r}' if isinstance(result, Exception) else f'{book.name}: no events'
+              for result, book in zip(results, books) if isinstance(result, Exception) or not result]
+    if failed:
+        # Don't overwrite the name map and review file with a run that can't match anything
+        raise RuntimeError(f'Book fetch failed, nothing written: {", ".join(failed)}')
+    books_data = [(result, book.name) for result, book in zip(results, books)]
+
+    with open(LEAGUE_MAP_PATH, 'r') as f:
+        league_map = json.load(f)
+    with open(TEAM_NAMES_PATH, 'r') as f:
+        team_map = json.load(f)
+
+    new_map = {league: dict(names) for league, names in team_map.items()}
+    review = []
+    for league, (teams, pin_teams) in collect_teams(books_data, league_map, team_map).items():
+        accepted, league_review = match_league(teams, pin_teams, accept_score, accept_margin)
+        new_map.setdefault(league, {}).update(accepted)
+        for entry in league_review:
+            entry['league'] = league
+        review.extend(league_review)
+        print(f'{league}: {len(accepted)} accepted, {len(league_review)} to review')
+
+    with open(NEW_NAME_MAP_PATH, 'w') as f:
+        json.dump(new_map, f, indent=4)
+    with open(REVIEW_PATH, 'w') as f:
+        json.dump(review, f, indent=4)
+    print(f'Wrote {NEW_NAME_MAP_PATH} and {len(review)} ambiguous teams to {REVIEW_PATH}')
+
+
+def merge_review(review_path=REVIEW_PATH, new_map_path=NEW_NAME_MAP_PATH):
+    """
+    Merge reviewed pairs into new_name_map.json. Set an entry's "match" to the chosen Pinnacle name to accept it, or
+    to "" to discard it; entries still at null stay in the review file.
+    """
+    with open(review_path, 'r') as f:
+        review = json.load(f)
+    source = new_map_path if os.path.exists(new_map_path) else TEAM_NAMES_PATH
+    with open(source, 'r') as f:
+        new_map = json.load(f)
+
+    pending = []
+    merged = 0
+    for entry in review:
+        if entry.get('match') is None:
+            pending.append(entry)
+        elif entry['match']:
+            new_map.setdefault(entry['league'], {})[entry['team']] = entry['match']
+            merged += 1
+
+    with open(new_map_path, 'w') as f:
+        json.dump(new_map, f, indent=4)
+    with open(review_path, 'w') as f:
+        json.dump(pending, f, indent=4)
+    print(f'Merged {merged} reviewed teams into {new_map_path}, {len(pending)} still pending')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Batch team name matching against Pinnacle')
+    parser.add_argument('step', choices=['match', 'merge'])
+    parser.add_argument('--sport', default='basketball')
+    parser.add_argument('--live', action='store_true')
+    args = parser.parse_args()
+    if args.step == 'match':
+        asyncio.run(run_batch_match(args.sport, args.live))
+    else:
+        merge_review()
@@ -1,24 +1,272 @@
 import asyncio
 import time
-import httpx
-import requests
+import ijson
 import pytz
 from datetime import datetime, timezone
 import psycopg2
 import psycopg2.extras
 import asyncpg
+import numpy as np
 
 
-from tools.devig import dec_to_amer, calculate_vig
+from tools.devig import dec_to_amer, calculate_vig, LRUCache
+from tools.history import HistoryStore
+from tools.persister import WriteBehind
+from tools.transport import transport
 
 key = "47459b6cc5msh408997758417086p1a4c4bjsna2d524d30b8d"
 
+est_zone = pytz.timezone('US/Eastern')
+
+
+class StreamReader:
+    """
+    Minimal async file object over a streamed httpx response, for ijson.
+    """
+    def __init__(self, response):
+        self.chunks = response.aiter_bytes()
+
+    async def read(self, size=-1):
+        # ijson probes with read(0) to check for bytes vs str
+        if size == 0:
+            return b''
+        try:
+            return await self.chunks.__anext__()
+        except StopAsyncIteration:
+            return b''
+
+
+async def stream_events(response, header):
+    """
+    Yield the items of a markets response's 'events' array one at a time as they are decoded from the byte stream.
+    Top-level scalars (the 'last' cursor) are collected into header.
+    """
+    builder = None
+    async for prefix, event, value in ijson.parse_async(StreamReader(response), use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == 'events.item' and event == 'end_map':
+                yield builder.value
+                builder = None
+        elif prefix == 'events.item' and event == 'start_map':
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+        elif '.' not in prefix and event in ('number', 'string', 'boolean', 'null'):
+            header[prefix] = value
+
+# Feeds repeat the same start and cutoff strings across events and polls, so each is parsed once
+start_cache = LRUCache(maxsize=16384)
+cutoff_cache = LRUCache(maxsize=65536)
+
+
+def parse_start(start_str):
+    """
+    :param start_str: Event start as sent by Pinnacle ('%Y-%m-%dT%H:%M:%S', UTC)
+    :return: (aware UTC datetime, 'Mon DD' date in US/Eastern)
+    """
+    parsed = start_cache.get(start_str)
+    if parsed is None:
+        dt_utc = pytz.utc.localize(datetime.strptime(start_str, '%Y-%m-%dT%H:%M:%S'))
+        parsed = (dt_utc, dt_utc.astimezone(est_zone).strftime("%b %d"))
+        start_cache.put(start_str, parsed)
+    return parsed
+
+
+def parse_cutoff(cutoff):
+    cutoff_time = cutoff_cache.get(cutoff)
+    if cutoff_time is None:
+        cutoff_time = datetime.fromisoformat(cutoff).replace(tzinfo=timezone.utc)
+        cutoff_cache.put(cutoff, cutoff_time)
+    return cutoff_time
+
+
+# Per-transaction staging tables for update_database, filled with COPY
+STAGING_TABLES = """
+    CREATE TEMP TABLE stage_events (
+        event_id BIGINT,
+        sport TEXT,
+        league TEXT,
+        home_team TEXT,
+        away_team TEXT,
+        start_time TIMESTAMP WITH TIME ZONE,
+        is_timeout BOOLEAN,
+        updated_at TIMESTAMP WITH TIME ZONE
+    ) ON COMMIT DROP;
+    CREATE TEMP TABLE stage_odds (
+        market_id INTEGER,
+        event_id BIGINT,
+        bookmaker_id INTEGER,
+        market_type TEXT,
+        selection TEXT,
+        one SMALLINT,
+        two SMALLINT,
+        alt BOOLEAN,
+        line NUMERIC,
+        max_limit DOUBLE PRECISION,
+        changed_at TIMESTAMP WITH TIME ZONE,
+        is_new BOOLEAN DEFAULT FALSE
+    ) ON COMMIT DROP;
+"""
+STAGE_ODDS_COLUMNS = ['market_id', 'event_id', 'bookmaker_id', 'market_type', 'selection', 'one', 'two', 'alt', 'line',
+                      'max_limit', 'changed_at']
+
+# Which stage_changes rows write odds_history and limit_history
+ODDS_CHANGED = "NOT has_odds OR (old_one, old_two, old_alt) IS DISTINCT FROM (one, two, alt)"
+LIMIT_CHANGED = "max_limit IS NOT NULL AND max_limit IS DISTINCT FROM old_limit"
+
+# Set-based merge of the staged batch; sent as one multi-statement round trip
+MERGE_STAGED = f"""
+    INSERT INTO events (event_id, sport, league, home_team, away_team, start_time, created_at, updated_at, is_timeout)
+    SELECT DISTINCT ON (event_id)
+        event_id, sport, league, home_team, away_team, start_time, updated_at, updated_at, is_timeout
+    FROM stage_events
+    ON CONFLICT (event_id) DO UPDATE SET
+        updated_at=EXCLUDED.updated_at,
+        is_timeout=EXCLUDED.is_timeout;
+
+    INSERT INTO markets (event_id, bookmaker_id, market_type, selection, created_at, updated_at)
+    SELECT DISTINCT ON (event_id, bookmaker_id, market_type, selection)
+        event_id, bookmaker_id, market_type, selection, changed_at, changed_at
+    FROM stage_odds
+    WHERE market_id IS NULL
+    ON CONFLICT (event_id, bookmaker_id, market_type, selection) DO UPDATE
+    SET updated_at=EXCLUDED.updated_at;
+
+    UPDATE stage_odds s SET market_id = m.market_id, is_new = TRUE
+    FROM markets m
+    WHERE s.market_id IS NULL AND m.event_id = s.event_id AND m.bookmaker_id = s.bookmaker_id
+        AND m.market_type = s.market_type AND m.selection = s.selection;
+
+    CREATE TEMP TABLE stage_changes ON COMMIT DROP AS
+    SELECT m.market_id, s.one, s.two, s.alt, s.line, s.max_limit, s.changed_at,
+           c.one AS old_one, c.two AS old_two, c.alt AS old_alt, l.max_limit AS old_limit,
+           c.market_id IS NOT NULL AS has_odds, l.market_id IS NOT NULL AS has_limit
+    FROM stage_odds s
+    JOIN markets m ON m.market_id = s.market_id
+    LEFT JOIN current_odds c ON c.market_id = m.market_id
+    LEFT JOIN current_limits l ON l.market_id = m.market_id;
+
+    INSERT INTO odds_history (market_id, old_one, old_two, new_one, new_two, alt, line, changed_at)
+    SELECT market_id, old_one, old_two, one, two, alt, line, changed_at FROM stage_changes
+    WHERE {ODDS_CHANGED};
+
+    INSERT INTO current_odds (market_id, one, two, alt, line, last_updated)
+    SELECT market_id, one, two, alt, line, changed_at FROM stage_changes
+    WHERE NOT has_odds;
+
+    UPDATE current_odds c SET one = s.one, two = s.two, alt = s.alt, line = s.line, last_updated = s.changed_at
+    FROM stage_changes s
+    WHERE c.market_id = s.market_id AND s.has_odds AND (s.old_one, s.old_two, s.old_alt) IS DISTINCT FROM (s.one, s.two, s.alt);
+
+    INSERT INTO limit_history (market_id, old_limit, new_limit, changed_at)
+    SELECT market_id, old_limit, max_limit, changed_at FROM stage_changes
+    WHERE {LIMIT_CHANGED};
+
+    INSERT INTO current_limits (market_id, max_limit, last_updated)
+    SELECT market_id, max_limit, changed_at FROM stage_changes
+    WHERE max_limit IS NOT NULL AND NOT has_limit;
+
+    UPDATE current_limits l SET max_limit = s.max_limit, last_updated = s.changed_at
+    FROM stage_changes s
+    WHERE l.market_id = s.market_id AND s.has_limit AND s.max_limit IS NOT NULL
+        AND s.max_limit IS DISTINCT FROM s.old_limit;
+"""
+
+# The history rows the merge just wrote for the given markets, in ODDS_HISTORY order, for the history store
+HISTORY_CHANGES = f"""
+    SELECT market_id, changed_at, one, two, NULL::DOUBLE PRECISION AS max_limit, 0 AS kind FROM stage_changes
+    WHERE market_id = ANY($1) AND ({ODDS_CHANGED})
+    UNION ALL
+    SELECT market_id, changed_at, NULL, NULL, max_limit, 1 FROM stage_changes
+    WHERE market_id = ANY($1) AND {LIMIT_CHANGED}
+    ORDER BY changed_at, kind
+"""
+
+# Ids of the markets the merge just created, for the write-through cache
+NEW_MARKET_IDS = """
+    SELECT market_id, event_id, market_type, selection FROM stage_odds WHERE is_new
+"""
+
+
+# One market's odds and limit history newer than the given ids, merged oldest first. Odds rows carry no limit and limit
+# rows no odds, so each row is (kind, id, changed_at, one, two, max_limit) with kind 0 for odds and 1 for limits.
+ODDS_HISTORY = """
+    WITH m AS (
+        SELECT market_id FROM markets
+        WHERE event_id = $1 AND bookmaker_id = $2 AND market_type = $3 AND selection = $4
+    )
+    SELECT 0 AS kind, h.history_id AS id, h.changed_at, h.new_one AS one, h.new_two AS two,
+           NULL::DOUBLE PRECISION AS max_limit
+    FROM odds_history h JOIN m USING (market_id)
+    WHERE h.history_id > $5
+    UNION ALL
+    SELECT 1, l.limit_history_id, l.changed_at, NULL, NULL, l.new_limit
+    FROM limit_history l JOIN m USING (market_id)
+    WHERE l.limit_history_id > $6
+    ORDER BY changed_at, kind, id
+"""
+
+
+# Bulk versions of ODDS_HISTORY: market ids for (event_id, market_type, selection) keys, then the odds and the limit
+# history of many markets, each market newer than its own last seen id
+BULK_MARKET_IDS = """
+    SELECT m.market_id, m.event_id, m.market_type, m.selection
+    FROM markets m
+    JOIN unnest($1::INTEGER[], $2::TEXT[], $3::TEXT[]) AS k(event_id, market_type, selection)
+        USING (event_id, market_type, selection)
+    WHERE m.bookmaker_id = $4
+"""
+
+BULK_ODDS_HISTORY = """
+    SELECT h.market_id, h.history_id AS id, h.changed_at, h.new_one AS one, h.new_two AS two
+    FROM odds_history h
+    JOIN unnest($1::INTEGER[], $2::BIGINT[]) AS k(market_id, last_id) USING (market_id)
+    WHERE h.market_id = ANY($1) AND h.history_id > k.last_id
+    ORDER BY h.changed_at, h.history_id
+"""
+
+BULK_LIMIT_HISTORY = """
+    SELECT l.market_id, l.limit_history_id AS id, l.changed_at, l.new_limit AS max_limit
+    FROM limit_history l
+    JOIN unnest($1::INTEGER[], $2::BIGINT[]) AS k(market_id, last_id) USING (market_id)
+    WHERE l.market_id = ANY($1) AND l.limit_history_id > k.last_id
+    ORDER BY l.changed_at, l.limit_history_id
+"""
+
+
+def smallint_odds(odds):
+    """
+    American odds clamped to the smallint odds columns.
+    """
+    if odds is None:
+        return None
+    return max(-32767, min(32767, int(odds)))
+
+
+# Pinnacle period keys and the names they're stored under, per sport
+PERIOD_TABLE = {
+    'baseball': (('num_0', 'full'), ('num_1', 'half')),
+    'tennis': (('num_0', 'full'), ('num_1', 'set 1'), ('num_2', 'set 2'), ('num_3', 'set 3'), ('num_4', 'set 4'),
+               ('num_5', 'set 5')),
+    'basketball': (('num_0', 'full'),),
+    'soccer': (('num_0', 'full'), ('num_1', 'half'), ('num_3', 'ot'), ('num_8', 'qual')),
+    'football': (('num_0', 'full'), ('num_1', 'half'), ('num_2', '2h'), ('num_3', '1q'), ('num_4', '2q'),
+                 ('num_5', '3q'), ('num_6', '4q')),
+    'hockey': (('num_0', 'full'), ('num_1', '1p'), ('num_2', '2p'), ('num_3', '3p'), ('num_6', 'reg')),
+}
+
 class Pinnacle:
-    def __init__(self, sport):
+    def __init__(self, sport, periods=None, markets=None, leagues=None, persist_full=False):
+        """
+        :param periods: Period names to parse (e.g. ['full']), None for all of the sport's periods
+        :param markets: Markets to parse ('Money Line', '3-way', 'spread', 'total'), None for all
+        :param leagues: Pinnacle league names to keep, None for all
+        :param persist_full: Parse and persist the whole feed to the database, projecting only what's returned
+        """
         self.name = "pin"
         self.ids = {'soccer': 1, 'tennis': 2, 'hockey': 4, 'football': 7, 'baseball': 9, 'basketball': 3}
         self.id = self.ids.get(sport)
-        self.client = httpx.AsyncClient(timeout=10)
+        self.client = transport
         self.sport = sport
         self.limits = {}
         self.timeouts = {}
@@ -30,12 +278,45 @@ class Pinnacle:
         self.data = None
         self.pool=None
 
+        self.period_table = PERIOD_TABLE.get(sport, ())
+        self.projected_periods = tuple((key, period) for key, period in self.period_table
+                                       if periods is None or period in periods)
+        self.markets = set(markets) if markets is not None else None
+        self.leagues = set(leagues) if leagues is not None else None
+        self.persist_full = persist_full
+
+        # Write-through cache of what's in the database, updated only after a commit:
+        # {event_id: {(market_type, selection): market_id}}, {market_id: ((one, two, alt), max_limit)}
+        self.market_cache = {}
+        self.odds_cache = {}
+
+        # Odds history already read back, extended incrementally:
+        # {(event_id, market_type, selection): (last history_id, last limit_history_id, rows)}
+        self.history_cache = LRUCache(maxsize=1024)
+        # In-memory history of the markets alerts have looked at, fed by update_database once seeded. Seeding and
+        # writes hold history_lock so a seed neither misses nor repeats a concurrent write.
+        self.history = HistoryStore()
+        self.history_lock = asyncio.Lock()
+
+        # UTC day history partitions were last ensured for (see migrations.py)
+        self.partitions_day = None
+
+        # Write-behind persister started by create(); without one, batches are written inline
+        self.persister = None
+
+        # Delta feed state per event type: {'last': cursor, 'polled_at': unix time, 'events': {event_id: event}}
+        self.feeds = {}
+        # Resync from scratch if the cursor hasn't advanced for this long (the API's lookback was 3000s)
+        self.cursor_ttl = 3000
+
     @classmethod
-    async def create(cls, sport, db_user, db_pass, db_name='odds_data_db', db_host='localhost', db_port=5432):
+    async def create(cls, sport, db_user, db_pass, db_name='odds_data_db', db_host='localhost', db_port=5432,
+                     **projection):
         """
-        Async factory method to create and initialize the Pinnacle instance.
+        Async factory method to create and initialize the Pinnacle instance. Extra keyword arguments are the
+        projection (see __init__).
         """
-        self = cls(sport)
+        self = cls(sport, **projection)
         # Create asyncpg connection pool
         self.pool = await asyncpg.create_pool(
             user=db_user,
@@ -45,8 +326,10 @@ class Pinnacle:
             port=db_port
         )
         self.bookmaker_id = await self.get_bookmaker_id("pin", "http://www.pinnacle.com")
-        # Optionally load initial data
-        self.data = await self.get_all_events_data(live=False)
+        await self.warm_cache()
+        self.persister = WriteBehind(self.update_database).start()
+        # Optionally load initial data; seeds the prematch event store, which keeps self.data current
+        self.data = await self.get_events_data(live=False)
         return self
 
     async def get_bookmaker_id(self, name, website=None):
@@ -74,65 +357,194 @@ class Pinnacle:
             "X-RapidAPI-Host": "pinnacle-odds.p.rapidapi.com"
         }
 
-        resp = requests.get(url, headers=headers, params=querystring)
+        resp = await self.client.get(url, headers=headers, params=querystring)
         try:
             data = resp.json()
             processed = self.process_data(data, live)
-            if processed:
-                await self.update_database(processed)
+            persist = self.process_data(data, live, full=True) if self.persist_full else processed
+            if persist:
+                await self.persist(persist)
             return processed
         except Exception as e:
             print(f'Error: {e}')
 
-    async def get_events_data(self, live=True):
+    async def get_events_data(self, live=True, persist=True):
+        """
+        Poll the markets feed and return the current snapshot of processed events.
+
+        Each event type keeps its own event store keyed by event_id and the API's 'last' cursor. Polls only ask for
+        events changed since the cursor, merge them into the store and persist just those; periods past their cutoff
+        expire from the store. A full resync happens when there is no usable cursor.
+
+        :param persist: Write changed events to the database; pass False to only read the feed (no pool needed)
+        """
+        event_type = 'live' if live else 'prematch'
+        feed = self.feeds.setdefault(event_type, {'last': None, 'polled_at': 0, 'events': {}})
+        resync = feed['last'] is None or time.time() - feed['polled_at'] > self.cursor_ttl
+
         url = "https://pinnacle-odds.p.rapidapi.com/kit/v1/markets"
-        current_unix_time = time.time()
         querystring = {
             "sport_id": self.id,
             "is_have_odds": "true",
-            "since": str(int(current_unix_time) - 3000),
-            'event_type': 'live' if live else 'prematch'
+            'event_type': event_type
         }
+        if not resync:
+            querystring['since'] = str(feed['last'])
         headers = {
             "X-RapidAPI-Key": key,
             "X-RapidAPI-Host": "pinnacle-odds.p.rapidapi.com"
         }
 
-        response = await self.client.get(url, headers=headers, params=querystring)
-        data = response.json()
-        processed_data = self.process_data(data, live)
-        if processed_data:
-            await self.update_database(processed_data)
-        return processed_data
+        # On resync build a fresh store, so a stream that fails halfway doesn't leave a partial one behind
+        events = {} if resync else feed['events']
+        header = {}
+        changed = {}
+        now = datetime.now(timezone.utc)
+        try:
+            async with self.client.stream('GET', url, headers=headers, params=querystring) as response:
+                response.raise_for_status()
+                # Events are parsed and merged one at a time as they come off the wire
+                async for event in stream_events(response, header):
+                    event_id = event.get('event_id')
+                    if self.persist_full:
+                        full = self.process_event(event, True, now)
+                        if full is not None:
+                            changed[full[0]] = full[1]
+                        processed = self.project(full)
+                    else:
+                        processed = self.process_event(event, now=now)
+                        if processed is not None:
+                            changed[processed[0]] = processed[1]
+                    if processed is None:
+                        events.pop(event_id, None)
+                    else:
+                        events[event_id] = processed
+        except Exception as e:
+            # Treat a failed poll as cursor loss so the next one resyncs
+            print(f'Pinnacle {event_type} feed error, resyncing next poll: {e}')
+            feed['last'] = None
+            return self.feed_snapshot(feed, live)
+
+        if header.get('last') is None:
+            print(f'Pinnacle {event_type} feed returned no cursor, resyncing next poll')
+            feed['last'] = None
+        else:
+            feed['last'] = header['last']
+            feed['polled_at'] = time.time()
+        if resync:
+            # Events the full snapshot no longer has won't expire from this feed anymore; forget them now unless the
+            # other event type still carries them
+            others = set().union(*[other['events'] for other in self.feeds.values() if other is not feed])
+            for event_id in feed['events'].keys() - events.keys() - others:
+                self.forget_event(event_id)
+        feed['events'] = events
+        self.expire_events(feed, now)
+
+        if changed and persist:
+            await self.persist(changed, now)
+        return self.feed_snapshot(feed, live)
+
+    async def persist(self, processed_data, captured_at=None):
+        """
+        Hand a batch to the write-behind persister, or write it inline when there is none.
+        """
+        if self.persister is not None:
+            self.persister.submit(processed_data, captured_at)
+        else:
+            captured_at = dict.fromkeys(processed_data, captured_at) if captured_at else None
+            await self.update_database(processed_data, captured_at)
 
-    async def update_database(self, processed_data):
+    async def close(self):
+        """
+        Flush pending writes and close the connection pool.
+        """
+        if self.persister is not None:
+            await self.persister.close()
+            self.persister = None
+        if self.pool is not None:
+            await self.pool.close()
+
+    def expire_events(self, feed, now=None):
+        """
+        Drop periods past their cutoff from a feed's event store, and events left without meaningful odds.
+        """
+        if now is None:
+            now = datetime.now(timezone.utc)
+        for event_id, (game_name, event_data, cutoffs) in list(feed['events'].items()):
+            expired = [period for period, cutoff in cutoffs.items() if now > cutoff]
+            if not expired:
+                continue
+            event_data = {period: data for period, data in event_data.items() if period not in expired}
+            cutoffs = {period: cutoff for period, cutoff in cutoffs.items() if period not in expired}
+            if any(key in event_data for key in ['full', 'half', 'ot', '2h']):
+                feed['events'][event_id] = (game_name, event_data, cutoffs)
+            else:
+                del feed['events'][event_id]
+                self.forget_event(event_id)
+
+    def feed_snapshot(self, feed, live):
+        snapshot = {game_name: event_data for game_name, event_data, _ in feed['events'].values()}
+        if not live:
+            self.data = snapshot
+        return snapshot
+
+    async def update_database(self, processed_data, captured_at=None):
+        """
+        Persist a batch of processed events in a fixed number of round trips: the batch is COPYed into temp staging
+        tables and merged into events, markets, current_odds/odds_history and current_limits/limit_history with
+        set-based statements, all in one transaction.
+
+        Every event in the batch is upserted, refreshing its updated_at. Odds rows are first diffed against the
+        write-through cache (see warm_cache), so only new markets and changed odds or limits are staged.
+
+        :param captured_at: {event key: datetime the event was fetched}, stamped on its rows; defaults to now
+        """
         if not processed_data:
             return
 
-        # Extract all events and markets
-        events_info = []  # (event_id, sport, league, home_team, away_team, start_time, is_timeout)
-        markets = []
-        odds_temp = []
-
-        now = datetime.now(timezone.utc)
+        fetched_at = datetime.now(timezone.utc)
         sport = self.sport
+        bookmaker_id = self.bookmaker_id
+
+        # (event_id, sport, league, home_team, away_team, start_time, is_timeout, updated_at)
+        # Both keyed so each event and market is staged once: the same event_id can come in under two event keys
+        # (Pinnacle renamed it between coalesced snapshots), and the latest capture wins
+        events_info = {}
+        # {(event_id, market_type, selection): (market_id or None if new, event_id, bookmaker_id, market_type,
+        #  selection, one, two, alt, line, max_limit, changed_at)}
+        odds_info = {}
 
         for event_key, event_data in processed_data.items():
             if 'info' not in event_data:
                 continue
 
             league = event_data['info']['league']
-            start_str = event_data['info']['start']
             external_event_id = event_data['info'].get('sql_key')
             away_team, home_team = event_key.split(" @ ")
-            dt_utc = datetime.strptime(start_str, '%Y-%m-%dT%H:%M:%S').replace(tzinfo=timezone.utc)
+            dt_utc = event_data['start_time']
             is_timeout = event_data['info'].get('is_timeout', False)
 
             event_id = int(external_event_id)
-            events_info.append((event_id, sport, league, home_team.strip(), away_team.strip(), dt_utc, is_timeout))
+            now = captured_at.get(event_key, fetched_at) if captured_at else fetched_at
+            if event_id in events_info and events_info[event_id][-1] > now:
+                continue
+            events_info[event_id] = (event_id, sport, league, home_team.strip(), away_team.strip(), dt_utc, is_timeout,
+                                     now)
+            known_markets = self.market_cache.get(event_id, {})
+
+            def stage(market_type, sel, odds, line, max_limit):
+                key = (event_id, market_type, sel)
+                market_id = known_markets.get((market_type, sel))
+                if market_id is not None:
+                    cached = self.odds_cache.get(market_id)
+                    if cached is not None and cached[0] == odds and (max_limit is None or cached[1] == max_limit):
+                        # Unchanged as of this capture; an older staged row for it would be stale
+                        odds_info.pop(key, None)
+                        return
+                odds_info[key] = (market_id, event_id, bookmaker_id, market_type, sel, *odds, line, max_limit, now)
 
             for period_name, period_data in event_data.items():
-                if period_name == 'info':
+                if period_name in ('info', 'start_time'):
                     continue
                 for market_type, market_details in period_data.items():
                     if market_type in ["Money Line", "3-way"]:
@@ -140,416 +552,354 @@ class Pinnacle:
                         keys = ['one', 'two', 'three'] if market_type == '3-way' else ['home', 'away']
                         for k in keys:
                             if k in market_details and market_details[k] is not None:
-                                sel = f"{period_name}:{market_type}:{k}"
-                                markets.append((event_id, self.bookmaker_id, market_type, sel))
-                                max_limit = market_details.get('max')
-                                odds_temp.append(((event_id, market_type, sel), str(market_details[k]), max_limit))
+                                stage(market_type, f"{period_name}:{market_type}:{k}",
+                                      (smallint_odds(market_details[k]), None, None), None, market_details.get('max'))
                     else:
                         # spread/total
                         for line_key, line_info in market_details.items():
-                            one_odds = line_info['one']
-                            two_odds = line_info['two']
-                            alt = line_info['alt']
-                            new_odds_str = f"{one_odds},{two_odds},{alt}"
-                            sel = f"{period_name}:{market_type}:{line_key}"
-                            markets.append((event_id, self.bookmaker_id, market_type, sel))
-                            max_limit = line_info.get('max')
-                            odds_temp.append(((event_id, market_type, sel), new_odds_str, max_limit))
-
-        # Upsert events
-        await self.upsert_events(events_info)
-
-        # Upsert markets
-        market_ids = await self.upsert_markets(markets)
-
-        # Prepare final odds data
-        final_odds_data = []
-        for ((e_id, mtype, sel), odds_str, max_limit) in odds_temp:
-            mid = market_ids.get((e_id, mtype, sel))
-            if mid:
-                final_odds_data.append((mid, odds_str, max_limit))
-
-        await self.bulk_upsert_odds(final_odds_data)
-        print("Database updated with current odds and limits.")
+                            odds = (smallint_odds(line_info['one']), smallint_odds(line_info['two']), line_info['alt'])
+                            stage(market_type, f"{period_name}:{market_type}:{line_key}", odds, float(line_key),
+                                  line_info.get('max'))
 
-    async def upsert_events(self, events_info):
-        if not events_info:
+        if not events_info and not odds_info:
             return
-        # Build a query string with placeholders
-        # columns: (event_id, sport, league, home_team, away_team, start_time, created_at, updated_at, is_timeout)
-        now = datetime.now(timezone.utc)
-        values = []
-        for e_id, s, l, h, a, st, timeout in events_info:
-            values.append((e_id, s, l, h, a, st, now, now, timeout))
-
-        # Dynamically build placeholders
-        # We have 9 columns per row
-        rows = []
-        args = []
-        arg_index = 1
-        for row in values:
-            placeholders = []
-            for col in row:
-                placeholders.append(f'${arg_index}')
-                arg_index += 1
-                args.append(col)
-            rows.append(f"({','.join(placeholders)})")
-        rows_str = ",".join(rows)
-
-        query = f"""
-            INSERT INTO events (event_id, sport, league, home_team, away_team, start_time, created_at, updated_at, is_timeout)
-            VALUES {rows_str}
-            ON CONFLICT (event_id) DO UPDATE SET 
-                updated_at=EXCLUDED.updated_at,
-                is_timeout=EXCLUDED.is_timeout
-        """
 
-        async with self.pool.acquire() as conn:
-            await conn.execute(query, *args)
+        today = fetched_at.date()
+        async with self.history_lock:
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    if self.partitions_day != today:
+                        # History is partitioned by day; make sure today's and the coming days' partitions exist
+                        await conn.execute("SELECT ensure_history_partitions()")
+                    await conn.execute(STAGING_TABLES)
+                    if events_info:
+                        await conn.copy_records_to_table('stage_events', records=list(events_info.values()))
+                    if odds_info:
+                        await conn.copy_records_to_table('stage_odds', records=list(odds_info.values()),
+                                                         columns=STAGE_ODDS_COLUMNS)
+                    await conn.execute(MERGE_STAGED)
+                    new_markets = await conn.fetch(NEW_MARKET_IDS) if odds_info else []
+                    # Only markets already in the history store can have changes to record; new ones can't be
+                    tracked = [row[0] for row in odds_info.values() if row[0] is not None and row[0] in self.history]
+                    changes = await conn.fetch(HISTORY_CHANGES, tracked) if tracked else []
+
+            # Only reached once the transaction has committed
+            self.partitions_day = today
+            new_ids = {(r['event_id'], r['market_type'], r['selection']): r['market_id'] for r in new_markets}
+            for market_id, event_id, _, market_type, sel, one, two, alt, _, max_limit, _ in odds_info.values():
+                if market_id is None:
+                    market_id = new_ids.get((event_id, market_type, sel))
+                    if market_id is None:
+                        continue
+                    self.market_cache.setdefault(event_id, {})[(market_type, sel)] = market_id
+                cached = self.odds_cache.get(market_id)
+                if max_limit is None and cached is not None:
+                    max_limit = cached[1]
+                self.odds_cache[market_id] = ((one, two, alt), max_limit)
+            for r in changes:
+                self.history.record(r['market_id'], r['changed_at'], r['one'], r['two'], r['max_limit'])
+        print("Database updated with current odds and limits.")
 
-    async def upsert_markets(self, markets):
-        if not markets:
-            return {}
-        # markets: (event_id, bookmaker_id, market_type, selection)
-        # We'll return a dict {(event_id, market_type, selection): market_id}
-        now = datetime.now(timezone.utc)
-        values = []
-        for e_id, b_id, m_t, sel in markets:
-            values.append((e_id, b_id, m_t, sel, now, now))
-
-        rows = []
-        args = []
-        arg_index = 1
-        for row in values:
-            placeholders = []
-            for col in row:
-                placeholders.append(f'${arg_index}')
-                arg_index += 1
-                args.append(col)
-            rows.append(f"({','.join(placeholders)})")
-        rows_str = ",".join(rows)
-
-        query = f"""
-        INSERT INTO markets (event_id, bookmaker_id, market_type, selection, created_at, updated_at)
-        VALUES {rows_str}
-        ON CONFLICT (event_id, bookmaker_id, market_type, selection) DO UPDATE
-        SET updated_at=EXCLUDED.updated_at
-        RETURNING market_id, event_id, market_type, selection;
+    async def warm_cache(self, days=1):
+        """
+        Load market ids and current odds/limits for this bookmaker's recent events into the write-through cache.
         """
-
         async with self.pool.acquire() as conn:
-            rows = await conn.fetch(query, *args)
-
-        market_ids = {(r['event_id'], r['market_type'], r['selection']): r['market_id'] for r in rows}
-        return market_ids
-
+            markets = await conn.fetch("""
+                SELECT m.market_id, m.event_id, m.market_type, m.selection, c.market_id AS has_odds, c.one, c.two, c.alt,
+                       l.max_limit
+                FROM markets m
+                JOIN events e ON e.event_id = m.event_id
+                LEFT JOIN current_odds c ON c.market_id = m.market_id
+                LEFT JOIN current_limits l ON l.market_id = m.market_id
+                WHERE m.bookmaker_id = $1 AND e.start_time > now() - make_interval(days => $2)
+            """, self.bookmaker_id, days)
+        for r in markets:
+            self.market_cache.setdefault(r['event_id'], {})[(r['market_type'], r['selection'])] = r['market_id']
+            if r['has_odds'] is not None:
+                self.odds_cache[r['market_id']] = ((r['one'], r['two'], r['alt']), r['max_limit'])
+        print(f"Warmed cache with {len(markets)} markets")
+
+    def forget_event(self, event_id):
+        """
+        Drop an event from the write-through cache; it's reloaded through the normal upserts if it comes back.
+        """
+        if event_id is None:
+            return
+        event_id = int(event_id)
+        for market_id in self.market_cache.pop(event_id, {}).values():
+            self.odds_cache.pop(market_id, None)
+            self.history.discard(market_id)
 
-    def process_data(self, data, live):
+    def process_data(self, data, live, full=False):
         events = data.get('events')
         if not events:
             return
         processed_data = {}
+        now = datetime.now(timezone.utc)
+        for event in events:
+            processed = self.process_event(event, full, now)
+            if processed:
+                game_name, event_data, _ = processed
+                processed_data[game_name] = event_data
+        return processed_data
 
-        utc_zone = pytz.utc
-        est_zone = pytz.timezone('US/Eastern')
+    def process_event(self, event, full=False, now=None):
+        """
+        Parse one raw API event, restricted to the projection unless full is set. Pass now to read the clock once per
+        batch rather than per period.
 
-        for event in events:
-            event_data = {}
-            league = event.get('league_name')
-            '''if 'NBA' in league or 'NCAA' in league:
-                continue'''
-
-            home = event.get('home')
-            away = event.get('away')
-            datetime_str = event.get('starts')
-            dt_utc = datetime.strptime(datetime_str, '%Y-%m-%dT%H:%M:%S')
-            dt_utc = utc_zone.localize(dt_utc)
-            dt_est = dt_utc.astimezone(est_zone)
-            formatted_date = dt_est.strftime("%b %d")
-
-            if '(Hits+Runs+Errors)' in home:
+        :return: (game name, event data, {period: cutoff datetime}), or None if the event has no open periods with odds
+        """
+        if full:
+            periods, markets = self.period_table, None
+        else:
+            periods, markets = self.projected_periods, self.markets
+            if self.leagues is not None and event.get('league_name') not in self.leagues:
+                return None
+        if not periods:
+            return None
+
+        if now is None:
+            now = datetime.now(timezone.utc)
+
+        event_data = {}
+        cutoffs = {}
+        league = event.get('league_name')
+        '''if 'NBA' in league or 'NCAA' in league:
+            return None'''
+
+        home = event.get('home')
+        away = event.get('away')
+        datetime_str = event.get('starts')
+
+        if '(Hits+Runs+Errors)' in home:
+            return None
+
+        start_time, formatted_date = parse_start(datetime_str)
+
+        external_event_id = str(event.get('event_id'))
+
+        event_data['info'] = {
+            'league': league,
+            'start': datetime_str,
+            'sql_key': external_event_id,
+            'date': formatted_date,
+            'is_timeout': False,
+        }
+        # Parsed start for update_database; kept beside info so it stays out of the merged view
+        event_data['start_time'] = start_time
+
+        want_ml = markets is None or 'Money Line' in markets
+        want_3way = markets is None or '3-way' in markets
+        want_spread = markets is None or 'spread' in markets
+        want_total = markets is None or 'total' in markets
+
+        id = f'{away} @ {home}'
+        raw_periods = event.get('periods', {})
+        for period_key, period in periods:
+            p = raw_periods.get(period_key, {})
+            if not p or p.get('period_status') == 2:
                 continue
-
-            external_event_id = str(event.get('event_id'))
-
-            event_data['info'] = {
-                'league': league,
-                'start': datetime_str,
-                'sql_key': external_event_id,
-                'date': formatted_date,
-                'is_timeout': False,
-            }
-
-            # Determine periods based on sport:
-            if self.sport == 'baseball':
-                fg = [event.get('periods', {}).get('num_0', {}), 'full']
-                h1 = [event.get('periods', {}).get('num_1', {}), 'half']
-                periods = [fg, h1]
-            elif self.sport == 'tennis':
-                fg = [event.get('periods', {}).get('num_0', {}), 'full']
-                s1 = [event.get('periods', {}).get('num_1', {}), 'set 1']
-                s2 = [event.get('periods', {}).get('num_2', {}), 'set 2']
-                s3 = [event.get('periods', {}).get('num_3', {}), 'set 3']
-                s4 = [event.get('periods', {}).get('num_4', {}), 'set 4']
-                s5 = [event.get('periods', {}).get('num_5', {}), 'set 5']
-                periods = [fg, s1, s2, s3, s4, s5]
-            elif self.sport == 'basketball':
-                fg = [event.get('periods', {}).get('num_0', {}), 'full']
-                periods = [fg]
-            elif self.sport == 'soccer':
-                fg = [event.get('periods', {}).get('num_0', {}), 'full']
-                h1 = [event.get('periods', {}).get('num_1', {}), 'half']
-                ot = [event.get('periods', {}).get('num_3', {}), 'ot']
-                qual = [event.get('periods', {}).get('num_8', {}), 'qual']
-                periods = [fg, h1, ot, qual]
-            elif self.sport == 'football':
-                fg = [event.get('periods', {}).get('num_0', {}), 'full']
-                h1 = [event.get('periods', {}).get('num_1', {}), 'half']
-                h2 = [event.get('periods', {}).get('num_2', {}), '2h']
-                q1 = [event.get('periods', {}).get('num_3', {}), '1q']
-                q2 = [event.get('periods', {}).get('num_4', {}), '2q']
-                q3 = [event.get('periods', {}).get('num_5', {}), '3q']
-                q4 = [event.get('periods', {}).get('num_6', {}), '4q']
-                periods = [fg, h1, h2, q1, q2, q3, q4]
-            elif self.sport == 'hockey':
-                fg = [event.get('periods', {}).get('num_0', {}), 'full']
-                p1 = [event.get('periods', {}).get('num_1', {}), '1p']
-                p2 = [event.get('periods', {}).get('num_2', {}), '2p']
-                p3 = [event.get('periods', {}).get('num_3', {}), '3p']
-                reg = [event.get('periods', {}).get('num_6', {}), 'reg']
-                periods = [fg, p1, p2, p3, reg]
-            else:
+            cutoff = p.get('cutoff')
+            cutoff_time = parse_cutoff(cutoff)
+            if now > cutoff_time:
                 continue
+            cutoffs[period] = cutoff_time
 
-            id = f'{away} @ {home}'
-            for p in periods:
-                period = p[-1]
-                p = p[0]
-                if not p or p.get('period_status') == 2:
-                    continue
-                cutoff = p.get('cutoff')
-                cutoff_time = datetime.fromisoformat(cutoff).replace(tzinfo=timezone.utc)
-                current_time = datetime.now(tz=timezone.utc)
-                if current_time > cutoff_time:
-                    continue
+            money_line = p.get('money_line', {}) or {}
+            period_data = event_data[period] = {}
 
-                money_line = p.get('money_line', {}) or {}
-
-                if self.sport != 'soccer' and (self.sport != 'hockey' or period != 'reg'):
-                    event_data[period] = {
-                        'Money Line': {
-                            'home': dec_to_amer(money_line.get('home')),
-                            'away': dec_to_amer(money_line.get('away')),
-                            'max': p.get('meta', {}).get('max_money_line')
-                        },
-                        'spread': {},
-                        'total': {}
+            if self.sport != 'soccer' and (self.sport != 'hockey' or period != 'reg'):
+                if want_ml:
+                    period_data['Money Line'] = {
+                        'home': dec_to_amer(money_line.get('home')),
+                        'away': dec_to_amer(money_line.get('away')),
+                        'max': p.get('meta', {}).get('max_money_line')
                     }
-                else:
-                    event_data[period] = {
-                        '3-way': {
-                            'one': dec_to_amer(money_line.get('home')),
-                            'two': dec_to_amer(money_line.get('away')),
-                            'three': dec_to_amer(money_line.get('draw')),
-                            'max': p.get('meta', {}).get('max_money_line')
-                        },
-                        'spread': {},
-                        'total': {}
-                    }
-
-                if p.get('spreads') is not None:
-                    for spread in p.get('spreads', {}).values():
-                        if spread.get('hdp') == 0:
-                            event_data[period]['Money Line'] = {
+            elif want_3way:
+                period_data['3-way'] = {
+                    'one': dec_to_amer(money_line.get('home')),
+                    'two': dec_to_amer(money_line.get('away')),
+                    'three': dec_to_amer(money_line.get('draw')),
+                    'max': p.get('meta', {}).get('max_money_line')
+                }
+            if want_spread:
+                period_data['spread'] = {}
+            if want_total:
+                period_data['total'] = {}
+
+            # The timeout check reads the full game's main spreads, so they're walked even if spreads are projected out
+            if p.get('spreads') is not None and (want_spread or want_ml or period == 'full'):
+                for spread in p.get('spreads', {}).values():
+                    if spread.get('hdp') == 0:
+                        if want_ml:
+                            period_data['Money Line'] = {
                                 'home': dec_to_amer(spread.get('home')),
                                 'away': dec_to_amer(spread.get('away')),
                                 'max': spread.get('max')
                             }
-                            continue
-                        alt = bool(spread.get('alt_line_id'))
-                        # Check if low vig triggers timeout
-                        if not alt and period == 'full':
-                            vig = calculate_vig([dec_to_amer(spread.get('home')), dec_to_amer(spread.get('away'))])
-                            if vig < 1.053:
-                                event_data['info']['is_timeout'] = True
-
-                        event_data[period]['spread'][spread.get('hdp')] = {
+                        continue
+                    alt = bool(spread.get('alt_line_id'))
+                    # Check if low vig triggers timeout
+                    if not alt and period == 'full':
+                        vig = calculate_vig([dec_to_amer(spread.get('home')), dec_to_amer(spread.get('away'))])
+                        if vig < 1.053:
+                            event_data['info']['is_timeout'] = True
+
+                    if want_spread:
+                        period_data['spread'][spread.get('hdp')] = {
                             'one': dec_to_amer(spread.get('home')),
                             'two': dec_to_amer(spread.get('away')),
                             'alt': alt,
                             'max': spread.get('max')
                         }
 
-                if p.get('totals') is not None:
-                    for total in p.get('totals', {}).values():
-                        event_data[period]['total'][total.get('points')] = {
-                            'one': dec_to_amer(total.get('over')),
-                            'two': dec_to_amer(total.get('under')),
-                            'alt': bool(total.get('alt_line_id')),
-                            'max': total.get('max')
-                        }
+            if want_total and p.get('totals') is not None:
+                for total in p.get('totals', {}).values():
+                    period_data['total'][total.get('points')] = {
+                        'one': dec_to_amer(total.get('over')),
+                        'two': dec_to_amer(total.get('under')),
+                        'alt': bool(total.get('alt_line_id')),
+                        'max': total.get('max')
+                    }
 
-            # Check if event_data contains meaningful odds
-            # (This condition is just ensuring we actually got some odds data)
-            if any(key in event_data for key in ['full', 'half', 'ot', '2h']):
-                processed_data[id] = event_data
+        # Check if event_data contains meaningful odds
+        # (This condition is just ensuring we actually got some odds data)
+        if any(key in event_data for key in ['full', 'half', 'ot', '2h']):
+            return id, event_data, cutoffs
+        return None
 
-        return processed_data
+    def project(self, processed):
+        """
+        Restrict a fully parsed event to the projection; same result as process_event(event) on the raw event.
+        """
+        if processed is None:
+            return None
+        game_name, event_data, cutoffs = processed
+        info = event_data['info']
+        if self.leagues is not None and info['league'] not in self.leagues:
+            return None
+        periods = {period for _, period in self.projected_periods}
+        projected = {'info': info if 'full' in periods else dict(info, is_timeout=False),
+                     'start_time': event_data['start_time']}
+        for period, period_data in event_data.items():
+            if period in periods:
+                projected[period] = {market: market_data for market, market_data in period_data.items()
+                                     if self.markets is None or market in self.markets}
+        if not any(key in projected for key in ['full', 'half', 'ot', '2h']):
+            return None
+        return game_name, projected, {period: cutoff for period, cutoff in cutoffs.items() if period in periods}
 
-    async def bulk_upsert_odds(self, odds_data):
-        if not odds_data:
-            return
+    async def get_odds_history(self, event_id, market_type, selection):
+        """
+        Odds and limit history of one event/market/selection, oldest first, as (changed_at, one, two, max_limit)
+        tuples: odds changes have max_limit None, limit changes have one and two None.
 
-        # odds_data: (market_id, new_odds_str, max_limit)
-        market_ids = [x[0] for x in odds_data]
+        Both histories come back merged in a single round trip; repeat calls only fetch rows newer than the last ones
+        seen for the market.
+        """
+        event_id = int(event_id)
+        key = (event_id, market_type, selection)
+        last_odds_id, last_limit_id, rows = self.history_cache.get(key, (0, 0, []))
 
-        # Fetch current odds
         async with self.pool.acquire() as conn:
-            records = await conn.fetch("SELECT market_id, odds FROM current_odds WHERE market_id = ANY($1)", market_ids)
-        current_map = {r['market_id']: r['odds'] for r in records}
-
-        history_inserts = []
-        current_inserts = []
-        current_updates = []
-
-        limit_history_inserts = []
-        limit_inserts = []
-        limit_updates = []
-
-        now = datetime.now(timezone.utc)
+            new_rows = await conn.fetch(ODDS_HISTORY, event_id, self.bookmaker_id, market_type, selection,
+                                        last_odds_id, last_limit_id)
+
+        if new_rows:
+            appended = [(r['changed_at'], r['one'], r['two'], r['max_limit']) for r in new_rows]
+            out_of_order = rows and appended[0][0] < rows[-1][0]
+            rows = rows + appended
+            if out_of_order:
+                rows.sort(key=lambda row: row[0])
+            last_odds_id = max([last_odds_id] + [r['id'] for r in new_rows if r['kind'] == 0])
+            last_limit_id = max([last_limit_id] + [r['id'] for r in new_rows if r['kind'] == 1])
+        self.history_cache.put(key, (last_odds_id, last_limit_id, rows))
+        return rows
+
+    async def get_odds_histories(self, keys):
+        """
+        Bulk get_odds_history for many (event_id, market_type, selection) keys in a constant number of round trips:
+        one for market ids missing from the market cache, one for odds history and one for limit history.
 
-        # Fetch current limits
-        async with self.pool.acquire() as conn:
-            limit_records = await conn.fetch("SELECT market_id, max_limit FROM current_limits WHERE market_id = ANY($1)", market_ids)
-        current_limits_map = {r['market_id']: r['max_limit'] for r in limit_records}
-
-        for (market_id, new_odds_str, max_limit) in odds_data:
-            old_odds = current_map.get(market_id)
-            if old_odds != new_odds_str:
-                history_inserts.append((market_id, old_odds, new_odds_str, now))
-                if old_odds is None:
-                    current_inserts.append((market_id, new_odds_str, now))
-                else:
-                    current_updates.append((new_odds_str, now, market_id))
-
-            old_limit = current_limits_map.get(market_id)
-            if max_limit is not None and max_limit != old_limit:
-                limit_history_inserts.append((market_id, old_limit, max_limit, now))
-                if old_limit is None:
-                    limit_inserts.append((market_id, max_limit, now))
-                else:
-                    limit_updates.append((max_limit, now, market_id))
+        :return: {(int(event_id), market_type, selection): [(changed_at, one, two, max_limit), ...]} oldest first,
+            [] for unknown markets
+        """
+        keys = {(int(event_id), market_type, selection) for event_id, market_type, selection in keys}
+        if not keys:
+            return {}
+        market_ids = {}
+        missing = []
+        for key in keys:
+            market_id = self.market_cache.get(key[0], {}).get(key[1:])
+            if market_id is None:
+                missing.append(key)
+            else:
+                market_ids[key] = market_id
 
         async with self.pool.acquire() as conn:
-            # Insert odds_history
-            if history_inserts:
-                # (market_id, old_odds, new_odds, changed_at)
-                await self._execute_many(conn,
-                    "INSERT INTO odds_history (market_id, old_odds, new_odds, changed_at) VALUES ($1, $2, $3, $4)",
-                    history_inserts
-                )
-
-            # current_odds
-            if current_inserts:
-                await self._execute_many(conn,
-                    "INSERT INTO current_odds (market_id, odds, last_updated) VALUES ($1, $2, $3)",
-                    current_inserts
-                )
-            if current_updates:
-                await self._execute_many(conn,
-                    "UPDATE current_odds SET odds=$1, last_updated=$2 WHERE market_id=$3",
-                    current_updates
-                )
-
-            # limits
-            if limit_history_inserts:
-                await self._execute_many(conn,
-                    "INSERT INTO limit_history (market_id, old_limit, new_limit, changed_at) VALUES ($1, $2, $3, $4)",
-                    limit_history_inserts
-                )
-
-            if limit_inserts:
-                await self._execute_many(conn,
-                    "INSERT INTO current_limits (market_id, max_limit, last_updated) VALUES ($1, $2, $3)",
-                    limit_inserts
-                )
-            if limit_updates:
-                await self._execute_many(conn,
-                    "UPDATE current_limits SET max_limit=$1, last_updated=$2 WHERE market_id=$3",
-                    limit_updates
-                )
-
-    async def _execute_many(self, conn, query, args_list):
-        # Helper method to run executemany-style commands in asyncpg
-        # asyncpg doesn't have executemany for DML the same way psycopg2 does,
-        # but we can just run them in a transaction.
-        async with conn.transaction():
-            for args in args_list:
-                await conn.execute(query, *args)
-
-    async def get_odds_history(self, event_id, market_type, selection):
+            if missing:
+                rows = await conn.fetch(BULK_MARKET_IDS, *[list(column) for column in zip(*missing)],
+                                        self.bookmaker_id)
+                for r in rows:
+                    market_ids[(r['event_id'], r['market_type'], r['selection'])] = r['market_id']
+                    self.market_cache.setdefault(r['event_id'], {})[(r['market_type'], r['selection'])] = r['market_id']
+
+            cached = {key: self.history_cache.get(key, (0, 0, [])) for key in market_ids}
+            ids = [market_ids[key] for key in cached]
+            odds_rows, limit_rows = [], []
+            if ids:
+                odds_rows = await conn.fetch(BULK_ODDS_HISTORY, ids, [cached[key][0] for key in cached])
+                limit_rows = await conn.fetch(BULK_LIMIT_HISTORY, ids, [cached[key][1] for key in cached])
+
+        # Same ordering as ODDS_HISTORY: changed_at, odds before limits, then id
+        new_rows = {}
+        for r in odds_rows:
+            new_rows.setdefault(r['market_id'], []).append((r['changed_at'], 0, r['id'], r['one'], r['two'], None))
+        for r in limit_rows:
+            new_rows.setdefault(r['market_id'], []).append((r['changed_at'], 1, r['id'], None, None, r['max_limit']))
+
+        histories = {key: [] for key in keys}
+        for key, (last_odds_id, last_limit_id, rows) in cached.items():
+            appended = sorted(new_rows.get(market_ids[key], []))
+            if appended:
+                out_of_order = rows and appended[0][0] < rows[-1][0]
+                rows = rows + [row[:1] + row[3:] for row in appended]
+                if out_of_order:
+                    rows.sort(key=lambda row: row[0])
+                last_odds_id = max([last_odds_id] + [row[2] for row in appended if row[1] == 0])
+                last_limit_id = max([last_limit_id] + [row[2] for row in appended if row[1] == 1])
+            self.history_cache.put(key, (last_odds_id, last_limit_id, rows))
+            histories[key] = rows
+        return histories
+
+    async def get_history_arrays(self, keys):
         """
-        Retrieve the full odds and limit history for the specified event/market/selection.
-        Returns a list of dictionaries, each representing a historical change (either odds or limit),
-        sorted by changed_at (descending).
-        """
-        event_id = int(event_id)
+        get_odds_histories served from the in-memory history store, as (n, 4) arrays of (ts, one, two, max_limit)
+        rows oldest first (see tools/history.py). Only markets the store isn't tracking yet are read from the
+        database, all in one get_odds_histories batch that seeds them.
 
-        async with self.pool.acquire() as conn:
-            # First, get the market_id
-            market_id = await conn.fetchval("""
-                SELECT market_id FROM markets 
-                WHERE event_id=$1 AND bookmaker_id=$2 AND market_type=$3 AND selection=$4
-            """, event_id, self.bookmaker_id, market_type, selection)
+        :return: {(int(event_id), market_type, selection): array}, empty arrays for unknown markets
+        """
+        keys = {(int(event_id), market_type, selection) for event_id, market_type, selection in keys}
+        histories = {}
+        missing = []
+        for key in keys:
+            market_id = self.market_cache.get(key[0], {}).get(key[1:])
+            rows = self.history.get(market_id) if market_id is not None else None
+            if rows is None:
+                missing.append(key)
+            else:
+                histories[key] = rows
 
-            if market_id is None:
-                # No such market found
-                return []
-
-            # Fetch odds history
-            odds_rows = await conn.fetch("""
-                SELECT history_id, market_id, old_odds, new_odds, changed_at
-                FROM odds_history
-                WHERE market_id=$1
-                ORDER BY changed_at ASC
-            """, market_id)
-
-            # Fetch limit history
-            limit_rows = await conn.fetch("""
-                SELECT limit_history_id, market_id, old_limit, new_limit, changed_at
-                FROM limit_history
-                WHERE market_id=$1
-                ORDER BY changed_at ASC
-            """, market_id)
-
-        changes = []
-
-        # Process odds history
-        for row in odds_rows:
-            changes.append({
-                'type': 'odds',
-                'history_id': row['history_id'],
-                'market_id': row['market_id'],
-                'old_value': row['old_odds'],
-                'new_value': row['new_odds'],
-                'changed_at': row['changed_at']
-            })
-
-        # Process limit history
-        for row in limit_rows:
-            changes.append({
-                'type': 'limit',
-                'history_id': row['limit_history_id'],
-                'market_id': row['market_id'],
-                'old_value': str(row['old_limit']) if row['old_limit'] is not None else None,
-                'new_value': str(row['new_limit']) if row['new_limit'] is not None else None,
-                'changed_at': row['changed_at']
-            })
-
-        # Sort all changes by changed_at descending
-        changes.sort(key=lambda x: x['changed_at'], reverse=True)
-
-        return changes
+        if missing:
+            async with self.history_lock:
+                seeded = await self.get_odds_histories(missing)
+                for key, rows in seeded.items():
+                    market_id = self.market_cache.get(key[0], {}).get(key[1:])
+                    histories[key] = np.empty((0, 4)) if market_id is None else self.history.seed(market_id, rows)
+        return histories
 
 
 class Betonline:
@@ -557,7 +907,7 @@ class Betonline:
         self.name = 'bol'
         self.sport = sport
         self.url = 'https://betonline-58db51404c56.herokuapp.com/data'
-        self.client = httpx.AsyncClient(timeout=10)
+        self.client = transport
         self.cache = {}
         self.cache_time = None
 
@@ -581,7 +931,7 @@ class Fanduel:
     def __init__(self, sport):
         self.name = 'fd'
         self.sport = sport
-        self.client = httpx.AsyncClient()
+        self.client = transport
         self.base_url = 'vm.egzee.com/fd'
 
     async def get_events_data(self, live=True):
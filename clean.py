@@ -1,23 +1,54 @@
+import re
+from functools import lru_cache
+
 import unidecode
 
+# Club prefixes/suffixes stripped from team names, one removal pass per entry in this order. 'bc' is applied twice
+# because removing a token joins its neighbours and can form a new ' bc ' (e.g. 'b cs c').
+CLUB_TOKENS = ('sk', 'fc', 'bc', 'bk', 'as', 'cs', 'hc', 'sp', 'cb', 'bc')
+
+_tokens = CLUB_TOKENS
+_token_re = None
+_count_re = None
+
+
+def set_club_tokens(tokens):
+    """
+    Replace the token passes clean_name strips, recompiling the matcher and dropping memoized results.
+    """
+    global _tokens, _token_re, _count_re
+    _tokens = tuple(tokens)
+    alternatives = '|'.join(re.escape(token) for token in dict.fromkeys(_tokens))
+    _token_re = re.compile(' (?:%s) ' % alternatives)
+    # Lookahead so tokens sharing a space (' fc sk ') are all counted
+    _count_re = re.compile('(?= (?:%s) )' % alternatives)
+    clean_name.cache_clear()
+
+
+@lru_cache(maxsize=65536)
 def clean_name(name):
-    name = unidecode.unidecode(name)
-    name = name.lower()
-    name = f' {name} '
-    name = name.replace(' sk ', '')
-    name = name.replace(' fc ', '')
-    name = name.replace(' bc ', '')
-    name = name.replace(' bk ', '')
-    name = name.replace(' as ', '')
-    name = name.replace(' cs ', '')
-    name = name.replace(' hc ', '')
-    name = name.replace(' sp ', '')
-    name = name.replace(' cb ', '')
-    name = name.replace(' bc ', '')
+    name = f' {unidecode.unidecode(name).lower()} '
+    matches = len(_count_re.findall(name))
+    if matches:
+        # A lone token removed without forming a new one is all the passes would do; anything else replays them
+        stripped = _token_re.sub('', name, count=1)
+        if matches == 1 and not _token_re.search(stripped):
+            name = stripped
+        else:
+            for token in _tokens:
+                name = name.replace(f' {token} ', '')
     name = name.replace('  ', ' ')
-    name = name.strip()
-    return name
+    return name.strip()
+
+
+def clean_names(names):
+    """
+    clean_name over an iterable of names, returned as a list.
+    """
+    return [clean_name(name) for name in names]
+
+
+set_club_tokens(CLUB_TOKENS)
 
 if __name__ == '__main__':
     print(clean_name('Bc Polkowice'))
-
@@ -73,31 +73,36 @@ def get_market_id(conn, event_id, bookmaker_id, market_type, selection):
     conn.commit()
     return market_id
 
-def update_odds(conn, market_id, new_odds):
+def update_odds(conn, market_id, new_odds, line=None):
+    """
+    :param new_odds: (one, two, alt) - American odds per side (two is None for moneylines) and the alt-line flag
+    """
     now = datetime.utcnow().replace(tzinfo=timezone.utc)
+    one, two, alt = new_odds
     with conn.cursor() as cur:
-        cur.execute("SELECT odds FROM current_odds WHERE market_id=%s", (market_id,))
+        cur.execute("SELECT one, two, alt FROM current_odds WHERE market_id=%s", (market_id,))
         row = cur.fetchone()
-        old_odds = row[0] if row else None
+        old_odds = tuple(row) if row else None
 
-        if old_odds != new_odds:
+        if old_odds != tuple(new_odds):
             # Insert into odds_history
             cur.execute("""
-                INSERT INTO odds_history (market_id, old_odds, new_odds, changed_at)
-                VALUES (%s, %s, %s, %s)
-            """, (market_id, old_odds, new_odds, now))
+                INSERT INTO odds_history (market_id, old_one, old_two, new_one, new_two, alt, line, changed_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            """, (market_id, old_odds[0] if old_odds else None, old_odds[1] if old_odds else None, one, two, alt,
+                  line, now))
 
             if old_odds is None:
                 # Insert current odds
                 cur.execute("""
-                    INSERT INTO current_odds (market_id, odds, last_updated)
-                    VALUES (%s, %s, %s)
-                """, (market_id, new_odds, now))
+                    INSERT INTO current_odds (market_id, one, two, alt, line, last_updated)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                """, (market_id, one, two, alt, line, now))
             else:
                 # Update current odds
                 cur.execute("""
-                    UPDATE current_odds SET odds=%s, last_updated=%s WHERE market_id=%s
-                """, (new_odds, now, market_id))
+                    UPDATE current_odds SET one=%s, two=%s, alt=%s, line=%s, last_updated=%s WHERE market_id=%s
+                """, (one, two, alt, line, now, market_id))
 
     conn.commit()
 
@@ -1,16 +1,21 @@
 import asyncio
 import json
+import marshal
 import time
 from datetime import datetime
 
+import numpy as np
 from rapidfuzz import process, fuzz
 
 from httpx import ReadTimeout
-from requests.structures import CaseInsensitiveDict
 
 from classes import Pinnacle, Betonline
 from clean import clean_name
-from tools.devig import worst_case_amer, dec_to_amer, calculate_ev, worst_case_amer_to_dec
+from team_index import TeamIndex, FuzzyTeamResolver
+from tools.devig import worst_case_amer, dec_to_amer, calculate_ev, devig_cache, amer_key, devig_batch
+from tools.ladder import LineIndex, get_curve, unwrap_odds
+from tools.odds import amer_to_dec_array, amer_to_imp_array, dec_to_amer_array
+from tools.transport import transport
 from sending import send_graph
 import logging
 
@@ -51,6 +56,9 @@ period_dict = {
 books = []
 periods = []
 
+# Scan with Datafetcher.find_ev_columnar instead of the nested-loop find_ev; both return the same rows
+columnar_scan = True
+
 
 async def timed_task(task, *args, **kwargs):
     start_time = time.time()
@@ -117,13 +125,13 @@ class Datafetcher:
         self.periods = period_dict.get(sport)
         self.markets = ['total', 'Money Line', 'spread', '3-way']
         self.pin_data = {}
-        with open('league_name_map.json', 'r') as f:
-            self.league_map = CaseInsensitiveDict(json.load(f))
-        with open('jsons/team_names.json', 'r') as f:
-            self.team_map = CaseInsensitiveDict(json.load(f))
+        self.names = TeamIndex()
+        self.fuzzy_names = FuzzyTeamResolver()
 
     async def post_init(self):
-        self.books.append(await Pinnacle.create(self.sport, 'odds_user', 'odds_password'))
+        self.books.append(await Pinnacle.create(self.sport, 'odds_user', 'odds_password', periods=self.periods,
+                                                markets=self.markets))
+        self.names.start()
 
     async def run(self):
         tasks = [timed_task(book.get_events_data, live=self.live) for book in self.books]
@@ -139,69 +147,42 @@ class Datafetcher:
             print(f"Task {book.name} took {duration:.2f} seconds")
             # Add the result and book name to books_data
             books_data.append((result, book.name))
-        view = {}
+        for data, book_name in books_data:
+            if book_name == 'pin' and data:
+                self.fuzzy_names.index_pinnacle(data)
+
+        # Resolve every game's identity once per book, then fan it out over periods and markets
+        resolved = []
+        for data, book_name in books_data:
+            if not data:
+                continue
+            games = []
+            for game_name, game_data in data.items():
+                game_name = self.resolve_game_name(game_name, game_data, book_name)
+                if game_name is None:
+                    continue
+                games.append((game_name, game_data, game_data.get('info', {}), game_data.get('link', None)))
+            resolved.append((book_name, games))
 
+        view = {}
         for period in self.periods:
             for market in self.markets:
-                for data, book_name in books_data:
-                    if not data:
-                        continue
-                    for game_name, game_data in data.items():
-                        game_name = game_name.title()
-                        if book_name != 'pin':
-                            init_league = game_data.get('league')
-                            if not init_league:
-                                continue
-                            league = self.league_map.get(init_league)
-                            if not league:
-                                print(f'No league name for {init_league}')
-                                continue
-                            league_name_map = CaseInsensitiveDict(self.team_map.get(league, {}))
-                            if not league_name_map:
-                                print(f'No team map for {league}')
-                                continue
-
-                            try:
-                                init_away_team, init_home_team = game_name.split(' @ ')
-                            except:
-                                continue
-
-
-                            home_team, away_team = league_name_map.get(init_home_team), league_name_map.get(init_away_team)
-                            if not home_team:
-                                print(f'No team name for {init_home_team}, {league}')
-                                continue
-                            if not away_team:
-                                print(f'No team name for {init_away_team}, {league}')
-                                continue
-                            game_name = f"{away_team} @ {home_team}".title()
-                        else:
-                            game_name = game_name.title()
+                for book_name, games in resolved:
+                    for game_name, game_data, game_info, link in games:
                         period_market_data = game_data.get(period, {}).get(market, {})
                         if not period_market_data:
                             period_market_data = game_data.get('odds', {}).get(period, {}).get(market, {})
                             if not period_market_data:
                                 continue
 
-                        game_info = game_data.get('info', {})
-                        game_date, game_league = game_info.get('date'), game_info.get('league')
-
-                        is_timeout = game_info.get('is_timeout', False)
-
-                        dk_timeout = game_info.get('dk_timeout', False)
-
-                        link = game_data.get('link', None)
-
                         row = {
                             'book': book_name,
-                            'is_timeout': is_timeout,
+                            'is_timeout': game_info.get('is_timeout', False),
                             'data': period_market_data,
-                            'dk_timeout': dk_timeout,
+                            'dk_timeout': game_info.get('dk_timeout', False),
                             'score': game_info.get('score', None),
                         }
 
-
-
                         view.setdefault(game_name, {}).setdefault(period, {}).setdefault(market, []).append(row)
                         if book_name == 'pin':
                             view[game_name]['info'] = game_info
@@ -209,6 +190,41 @@ class Datafetcher:
                             view[game_name]['link'] = link
         return view
 
+    def resolve_game_name(self, game_name, game_data, book_name):
+        """
+        Canonical 'Away @ Home' name for a book's game, or None when its league or teams can't be mapped.
+        """
+        game_name = game_name.title()
+        if book_name == 'pin':
+            return game_name
+        init_league = game_data.get('league')
+        if not init_league:
+            return None
+        league = self.names.league(init_league)
+        if not league:
+            print(f'No league name for {init_league}')
+            return None
+        if not self.names.has_teams(league):
+            print(f'No team map for {league}')
+            return None
+
+        try:
+            init_away_team, init_home_team = game_name.split(' @ ')
+        except:
+            return None
+
+        home_team, away_team = self.resolve_team(league, init_home_team), self.resolve_team(league, init_away_team)
+        if not home_team:
+            print(f'No team name for {init_home_team}, {league}')
+            return None
+        if not away_team:
+            print(f'No team name for {init_away_team}, {league}')
+            return None
+        return f"{away_team} @ {home_team}".title()
+
+    def resolve_team(self, league, raw_team):
+        return self.names.team(league, raw_team) or self.fuzzy_names.resolve(league, raw_team)
+
     @staticmethod
     def find_ev(data, sport, sharp_name='pin', need_timeout=False, dk_timeout=False, fallback_sharp=None, ev_threshold=5,
                 spread_threshold=1, total_threshold=1.5, half_threshold=1):
@@ -264,6 +280,8 @@ class Datafetcher:
 
         def process_market_data(market_data, sharp_data, game, period, market, score, sharp_name, game_info, link):
             away_team, home_team = game.split(' @ ')
+            ladder = None
+            off_ladder = None
             for row in market_data:
                 if row['book'] == sharp_name or row['book'] in ['pin']:
                     continue
@@ -311,21 +329,20 @@ class Datafetcher:
 
                                 'sport': sport,
                                 'game_info': game_info,
-                                'limit': sharp_dataget('limit', None)
+                                'limit': sharp_data.get('max', None)
                             })
                     else:
 
                         if is_convertible_to_float(bet_name):  # if market is total or spread
+                            if ladder is None:
+                                ladder = LineIndex(sharp_data)
                             num = float(bet_name)
-                            if num not in sharp_data:
-                                num = str(num)
-                                if num not in sharp_data:
-                                    num=float(num)
-
-                            if num in sharp_data:
-                                sharp_bet_one = sharp_data[num].get('one')
-                                sharp_bet_two = sharp_data[num].get('two')
-                                limit = sharp_data[num].get('max', None)
+
+                            if num in ladder:
+                                sharp_line = ladder.get(num)
+                                sharp_bet_one = sharp_line.get('one')
+                                sharp_bet_two = sharp_line.get('two')
+                                limit = sharp_line.get('max', None)
                                 if isinstance(sharp_bet_one, list):
                                     sharp_bet_one = sharp_bet_one[0]
                                 if isinstance(sharp_bet_two, list):
@@ -363,97 +380,75 @@ class Datafetcher:
                                                  link,
                                                  bet_two_odds, market_name, sharp_name, score, limit, [sharp_bet_two, sharp_bet_one])
                             else:
-                                sharp_keys = sorted([float(key) for key in sharp_data.keys()])
-                                closest_number = min(sharp_keys, key=lambda x: abs(x - float(num)))
-                                limit = sharp_data.get(closest_number, {}).get('max', None)
+                                if off_ladder is None:
+                                    # Price every off-ladder soft line of this market in one vectorized curve call
+                                    curve = get_curve(ladder, market)
+                                    off_lines = sorted({float(key) for soft_row in market_data
+                                                        if soft_row['book'] != sharp_name and soft_row['book'] != 'pin'
+                                                        for key in soft_row['data'] if is_convertible_to_float(key)
+                                                        and float(key) not in ladder})
+                                    off_ladder = {} if curve is None else {
+                                        side_name: dict(zip(off_lines, curve(off_lines, side_name).tolist()))
+                                        for side_name in ('one', 'two')}
+                                if not off_ladder:
+                                    continue
+                                closest_number = ladder.nearest(num)
+                                limit = ladder.get(closest_number).get('max', None)
 
+                                difference = num - closest_number
                                 if market == 'total':
-                                    difference = float(num) - closest_number
                                     if difference > 0:
                                         side = 'two', 'one'
-                                        second_closest_number = closest_number - 0.5
                                         bet_desc = f'u{num}'
-
-                                        def calculate_slope(closest_imp, second_imp):
-                                            return (closest_imp - second_imp) * 2
                                     else:
                                         side = 'one', 'two'
-                                        second_closest_number = closest_number + 0.5
                                         bet_desc = f'o{num}'
-
-                                        def calculate_slope(closest_imp, second_imp):
-                                            return (second_imp - closest_imp) * 2
                                 else:
                                     if (num > 0) != (closest_number > 0):
                                         continue
-                                    difference = float(num) - closest_number
                                     if difference > 0:
                                         side = 'one', 'two'
-                                        second_closest_number = closest_number - 0.5
                                         bet_desc = f'{home_team} {format_fv(num, False)}'
-
-                                        def calculate_slope(closest_imp, second_imp):
-                                            return (closest_imp - second_imp) * 2
                                     else:
                                         side = 'two', 'one'
-                                        second_closest_number = closest_number + 0.5
                                         bet_desc = f'{away_team} {(format_fv((-float(num)), False))}'
-
-                                        def calculate_slope(closest_imp, second_imp):
-                                            return (second_imp - closest_imp) * 2
-                                sharp_closest = sharp_data.get(closest_number)
-                                if sport == 'basketball':
-                                    sharp_second_closest = sharp_data.get(second_closest_number)
-                                    if sharp_second_closest:
-                                        closest_fair = float(
-                                            worst_case_amer_to_dec([sharp_closest[side[0]], sharp_closest[side[1]]]))
-                                        closest_imp = 1 / closest_fair
-                                        second_closest_fair = float(
-                                            worst_case_amer_to_dec([sharp_second_closest[side[0]], sharp_second_closest[side[1]]]))
-                                        second_closest_imp = 1 / second_closest_fair
-                                        slope = calculate_slope(closest_imp, second_closest_imp)
-                                        boost = difference * slope
-                                        bet_imp = boost + closest_imp
-                                        if sport != 'basketball':
-                                            bet_imp = closest_imp
-                                        fair_american = dec_to_amer(1 / bet_imp)
-                                        bet_info = bet_data.get(side[0], None)
-                                        if isinstance(bet_info, list):
-                                            odds, _ = bet_info
-                                        elif isinstance(bet_info, dict):
-                                            odds, _ = bet_info['odds'], bet_info['link']
-                                        else:
-                                            odds = bet_info
-                                        if odds is None:
-                                            continue
-                                        if isinstance(bet_info, dict) and 'alternate' in bet_info.get('market', '').lower():
-                                            if odds < -120:
-                                                continue
-                                        if odds < -150:
-                                            continue
-                                        bet_info = calculate_ev(odds, fair_american)
-                                        if bet_info[0] > ev_threshold:
-                                            rows.append({
-                                                'book': row['book'],
-                                                'odds': format_fv(odds),
-                                                'link': link,
-                                                'ev': round(bet_info[0], 1),
-                                                'qk': round(bet_info[1], 2),
-                                                'bet': f"{period if period != 'full' else ''} {bet_desc}",
-                                                'fair': format_fv(fair_american),
-                                                'sharp': sharp_name,
-                                                'game': f'{away_team} @ {home_team}{" " + score if score else ""}',
-                                                'ld': 'ext',
-                                                'sport': sport,
-                                                'game_info': game_info,
-                                                'limit': limit,
-                                                'market': market,
-                                                'num': num,
-                                                'sharp_odds': f'{sharp_closest[side[0]]}/{sharp_closest[side[1]]} ({closest_number})',
-                                                'side': side[0],
-
-                                            })
-
+                                sharp_closest = ladder.get(closest_number)
+                                fair_american = dec_to_amer(1 / off_ladder[side[0]][num])
+                                bet_info = bet_data.get(side[0], None)
+                                if isinstance(bet_info, list):
+                                    odds, _ = bet_info
+                                elif isinstance(bet_info, dict):
+                                    odds, _ = bet_info['odds'], bet_info['link']
+                                else:
+                                    odds = bet_info
+                                if odds is None:
+                                    continue
+                                if isinstance(bet_info, dict) and 'alternate' in bet_info.get('market', '').lower():
+                                    if odds < -120:
+                                        continue
+                                if odds < -150:
+                                    continue
+                                bet_info = calculate_ev(odds, fair_american)
+                                if bet_info[0] > ev_threshold:
+                                    rows.append({
+                                        'book': row['book'],
+                                        'odds': format_fv(odds),
+                                        'link': link,
+                                        'ev': round(bet_info[0], 1),
+                                        'qk': round(bet_info[1], 2),
+                                        'bet': f"{period if period != 'full' else ''} {bet_desc}",
+                                        'fair': format_fv(fair_american),
+                                        'sharp': sharp_name,
+                                        'game': f'{away_team} @ {home_team}{" " + score if score else ""}',
+                                        'ld': 'ext',
+                                        'sport': sport,
+                                        'game_info': game_info,
+                                        'limit': limit,
+                                        'market': market,
+                                        'num': num,
+                                        'sharp_odds': f'{sharp_closest[side[0]]}/{sharp_closest[side[1]]} ({closest_number})',
+                                        'side': side[0],
+                                    })
 
 
                         else:  # moneyline
@@ -532,39 +527,453 @@ class Datafetcher:
 
         return sort_dicts_by_key(rows, 'ev'), sort_dicts_by_key(ld_rows, 'diff')
 
+    @staticmethod
+    def find_ev_columnar(data, sport, sharp_name='pin', need_timeout=False, dk_timeout=False, fallback_sharp=None,
+                         ev_threshold=5, spread_threshold=1, total_threshold=1.5, half_threshold=1, by_market=False):
+        """
+        Drop-in alternative to find_ev that returns the same rows.
 
+        The view is flattened into aligned columns, one entry per candidate bet. Every distinct sharp price is then
+        devigged in a single batch per outcome count, EV and quarter Kelly are computed with array math, and result
+        dicts are only built for candidates above ev_threshold.
+
+        With by_market=True the unsorted rows are returned grouped by (game, period, market) instead.
+        """
+        ev_threshold = float(ev_threshold)
+
+        # Aligned candidate columns
+        soft_odds = []
+        fair_keys = []
+        kinds = []
+        metas = []
+        # Off-ladder lines priced from the fitted ladder curve: (curve id, side) -> (curve, [(candidate, line)])
+        ext_rows = {}
+
+        def soft_price(bet_data):
+            if isinstance(bet_data, list):
+                return bet_data[0], bet_data[1]
+            if isinstance(bet_data, dict):
+                return bet_data['odds'], bet_data['link']
+            return bet_data, None
+
+        def add(kind, odds, fair_key, meta):
+            kinds.append(kind)
+            soft_odds.append(float(odds))
+            fair_keys.append(fair_key)
+            metas.append(meta)
+
+        def flatten_market(market_data, sharp_data, game, period, market, score, sharp, game_info, link):
+            away_team, home_team = game.split(' @ ')
+            ctx = (game, period, market, score, sharp, game_info, home_team, away_team)
+            ladder = None
+            for row in market_data:
+                if row['book'] == sharp or row['book'] in ['pin']:
+                    continue
+                if sharp != 'pin' and row['book'] != 'fliff':
+                    continue
+                for bet_name, bet_data in row['data'].items():
+                    if market == '3-way':
+                        sides = ['one', 'two', 'three']
+                        sides.remove(bet_name)
+                        if not sharp_data[bet_name] or not sharp_data[sides[0]] or not sharp_data[sides[1]]:
+                            continue
+                        key = amer_key([sharp_data[bet_name], sharp_data[sides[0]], sharp_data[sides[1]]])
+                        odds, _ = soft_price(bet_data)
+                        if odds == 'N/A':
+                            continue
+                        add('3-way', odds, key, (ctx, row['book'], odds, link, bet_name, sharp_data.get('max', None)))
+                    elif is_convertible_to_float(bet_name):
+                        if ladder is None:
+                            ladder = LineIndex(sharp_data)
+                        num = float(bet_name)
+
+                        if num in ladder:
+                            sharp_line = ladder.get(num)
+                            sharp_bet_one = unwrap_odds(sharp_line.get('one'))
+                            sharp_bet_two = unwrap_odds(sharp_line.get('two'))
+                            limit = sharp_line.get('max', None)
+                            one_key = amer_key([sharp_bet_one, sharp_bet_two])
+                            bet_one_odds, _ = soft_price(bet_data.get('one'))
+                            bet_two_odds, _ = soft_price(bet_data.get('two'))
+                            sharp_odds = f'{sharp_bet_one}/{sharp_bet_two}'
+                            if bet_one_odds and bet_one_odds != 'N/A':
+                                add('line', bet_one_odds, one_key,
+                                    (ctx, row['book'], bet_one_odds, link, 'one', num, limit, sharp_odds))
+                            if bet_two_odds and bet_two_odds != 'N/A':
+                                add('line', bet_two_odds, one_key[::-1],
+                                    (ctx, row['book'], bet_two_odds, link, 'two', num, limit,
+                                     f'{sharp_bet_two}/{sharp_bet_one}'))
+                        else:
+                            curve = get_curve(ladder, market)
+                            if curve is None:
+                                continue
+                            closest_number = ladder.nearest(num)
+                            limit = ladder.get(closest_number).get('max', None)
+                            difference = num - closest_number
+                            if market == 'total':
+                                if difference > 0:
+                                    side = 'two', 'one'
+                                    bet_desc = f'u{num}'
+                                else:
+                                    side = 'one', 'two'
+                                    bet_desc = f'o{num}'
+                            else:
+                                if (num > 0) != (closest_number > 0):
+                                    continue
+                                if difference > 0:
+                                    side = 'one', 'two'
+                                    bet_desc = f'{home_team} {format_fv(num, False)}'
+                                else:
+                                    side = 'two', 'one'
+                                    bet_desc = f'{away_team} {(format_fv((-float(num)), False))}'
+                            sharp_closest = ladder.get(closest_number)
+                            bet_info = bet_data.get(side[0], None)
+                            odds, _ = soft_price(bet_info)
+                            if odds is None:
+                                continue
+                            if isinstance(bet_info, dict) and 'alternate' in bet_info.get('market', '').lower():
+                                if odds < -120:
+                                    continue
+                            if odds < -150:
+                                continue
+                            ext_rows.setdefault((id(curve), side[0]), (curve, []))[1].append((len(kinds), num))
+                            add('ext', odds, None,
+                                (ctx, row['book'], odds, link, side[0], num, limit, bet_desc,
+                                 f'{sharp_closest[side[0]]}/{sharp_closest[side[1]]} ({closest_number})'))
+                    else:
+                        side_2 = 'home' if bet_name == 'away' else 'away'
+                        limit = sharp_data.get('max', None)
+                        try:
+                            key = amer_key([sharp_data[bet_name], sharp_data[side_2]])
+                        except:
+                            try:
+                                key = amer_key([sharp_data[bet_name][0], sharp_data[side_2][0]])
+                            except:
+                                continue
+                        if isinstance(bet_data, list):
+                            odds, link = bet_data
+                        elif isinstance(bet_data, dict):
+                            odds, link = bet_data['odds'], bet_data['link']
+                        else:
+                            odds = bet_data
+                        if odds is None or odds == 'N/A':
+                            continue
+                        add('ml', odds, key, (ctx, row['book'], odds, link, bet_name, limit,
+                                              f'{sharp_data[bet_name]}/{sharp_data[side_2]}'))
+
+        for game, game_data in data.items():
+            link = game_data.get('link')
+            game_info = game_data.get('info', {})
+            for period, period_data in game_data.items():
+                if period == 'info' or period == 'link':
+                    continue
+                for market_name, market_data in period_data.items():
+                    score = None
+                    for row in market_data:
+                        if row.get('score'):
+                            score = row['score']
+                            break
+                    timeout = False
+                    if dk_timeout:
+                        if any(row.get('dk_timeout') == True for row in market_data):
+                            print(f'{game} {period} {market_name} has a timeout')
+                            timeout = True
+
+                    if not timeout and need_timeout and not any(row['is_timeout'] for row in market_data) and sport == 'basketball':
+                        continue
+                    sharp_row, sharp = None, None
+                    for row in market_data:
+                        if row['book'] == sharp_name:
+                            sharp_row, sharp = row, sharp_name
+                            break
+                    if sharp_row is None and fallback_sharp:
+                        for row in market_data:
+                            if row['book'] == fallback_sharp:
+                                sharp_row, sharp = row, fallback_sharp
+                                break
+                    if not sharp_row or not sharp_row.get('data'):
+                        continue
+
+                    flatten_market(market_data, sharp_row['data'], game, period, market_name, score, sharp, game_info,
+                                   link)
+
+        if not kinds:
+            return {} if by_market else ([], [])
+
+        # Devig every distinct sharp price once, batched by number of outcomes
+        worst = {}
+        by_outcomes = {}
+        for key in set(fair_keys):
+            if key is not None:
+                by_outcomes.setdefault(len(key), []).append(key)
+        for keys in by_outcomes.values():
+            fairs = devig_batch(amer_to_dec_array(keys))[2][:, 0]
+            worst.update(zip(keys, fairs))
+
+        n = len(kinds)
+        fair = np.empty(n)
+        for i, key in enumerate(fair_keys):
+            if key is not None:
+                fair[i] = worst[key]
+
+        for (_, side), (curve, candidates) in ext_rows.items():
+            positions, lines = zip(*candidates)
+            fair[list(positions)] = dec_to_amer_array(1 / curve(lines, side))
+
+        fair_prob = amer_to_imp_array(fair)
+        dec = amer_to_dec_array(soft_odds)
+        edge = ((dec - 1) * fair_prob) - (1 - fair_prob)
+        ev = edge * 100
+        qk = edge / (dec - 1) * 25
+        passed = ev > ev_threshold
+        for i, kind in enumerate(kinds):
+            if kind == 'ml' or kind == '3-way':
+                passed[i] = passed[i] and ev[i] != 0
+
+        fair = fair.tolist()
+        ev = ev.tolist()
+        qk = qk.tolist()
+        rows = []
+        market_keys = []
+        for i in np.flatnonzero(passed).tolist():
+            kind = kinds[i]
+            ctx, book, odds, link = metas[i][:4]
+            market_keys.append(ctx[:3])
+            game, period, market, score, sharp, game_info, home_team, away_team = ctx
+            period_prefix = period if period != 'full' else ''
+            game_desc = f'{away_team} @ {home_team}{" " + score if score else ""}'
+            fair_value = fair[i] if kind != 'ext' else int(fair[i])
+            if kind == 'line':
+                name, num, limit, sharp_odds = metas[i][4:]
+                if market == 'total':
+                    bet_desc = f'o{num}' if name == 'one' else f'u{num}'
+                else:
+                    bet_desc = f'{home_team} {format_fv(num, False)}' if name == 'one' else f'{away_team} {format_fv(-float(num), False)}'
+                rows.append({
+                    'book': book,
+                    'odds': format_fv(odds),
+                    'link': link,
+                    'ev': round(ev[i], 1),
+                    'qk': round(qk[i], 2),
+                    'bet': f"{period_prefix} {bet_desc}",
+                    'fair': format_fv(fair_value),
+                    'sharp': sharp,
+                    'game': game_desc,
+                    'sport': sport,
+                    'game_info': game_info,
+                    'limit': limit,
+                    'market': market,
+                    'num': num,
+                    'sharp_odds': sharp_odds,
+                    'side': name
+                })
+            elif kind == 'ext':
+                side, num, limit, bet_desc, sharp_odds = metas[i][4:]
+                rows.append({
+                    'book': book,
+                    'odds': format_fv(odds),
+                    'link': link,
+                    'ev': round(ev[i], 1),
+                    'qk': round(qk[i], 2),
+                    'bet': f"{period_prefix} {bet_desc}",
+                    'fair': format_fv(fair_value),
+                    'sharp': sharp,
+                    'game': game_desc,
+                    'ld': 'ext',
+                    'sport': sport,
+                    'game_info': game_info,
+                    'limit': limit,
+                    'market': market,
+                    'num': num,
+                    'sharp_odds': sharp_odds,
+                    'side': side,
+                })
+            elif kind == 'ml':
+                bet_name, limit, sharp_odds = metas[i][4:]
+                rows.append({
+                    'book': book,
+                    'odds': format_fv(odds),
+                    'link': link,
+                    'ev': round(ev[i], 1),
+                    'qk': round(qk[i], 2),
+                    'bet': f"{period_prefix} {home_team if bet_name == 'home' else away_team} ML",
+                    'fair': format_fv(fair_value),
+                    'sharp': sharp,
+                    'game': game_desc,
+                    'sport': sport,
+                    'game_info': game_info,
+                    'limit': limit,
+                    'market': market,
+                    'num': bet_name,
+                    'sharp_odds': sharp_odds,
+                    'side': 'one'
+                })
+            else:
+                bet_name, limit = metas[i][4:]
+                if bet_name == 'one':
+                    bet = home_team
+                elif bet_name == 'two':
+                    bet = away_team
+                else:
+                    bet = 'draw'
+                rows.append({
+                    'book': book,
+                    'odds': format_fv(odds),
+                    'link': link,
+                    'ev': round(ev[i], 1),
+                    'qk': round(qk[i], 2),
+                    'bet': f"{period_prefix} {bet} 3-Way ML",
+                    'fair': format_fv(fair_value),
+                    'sharp': sharp,
+                    'game': game_desc,
+                    'sport': sport,
+                    'game_info': game_info,
+                    'limit': limit
+                })
+
+        if by_market:
+            grouped = {}
+            for key, row in zip(market_keys, rows):
+                grouped.setdefault(key, []).append(row)
+            return grouped
+        return sort_dicts_by_key(rows, 'ev'), []
+
+
+
+class IncrementalScanner:
+    """
+    Keeps the previous cycle's EV rows per (game, period, market) and only rescans markets whose quotes changed.
+
+    Each market is fingerprinted per book from its rows plus the game's info and link. Markets whose fingerprint
+    matches last cycle reuse their cached rows, changed or new markets are rescanned and markets that disappeared from
+    the view are dropped. With columnar=True all changed markets are rescanned in one find_ev_columnar batch,
+    otherwise find_ev runs once per changed market.
+    """
+    def __init__(self, columnar=True):
+        self.columnar = columnar
+        self.fingerprints = {}
+        self.rows = {}
+        self.scan_args = None
+        self.last_changed = 0
+        self.last_total = 0
+
+    @staticmethod
+    def digest(obj):
+        # marshal v2 has no back-references, so equal quotes always serialize to equal bytes
+        try:
+            return hash(marshal.dumps(obj, 2))
+        except ValueError:
+            return hash(repr(obj))
+
+    def fingerprint(self, market_data, game_info, link):
+        books = tuple((row['book'], self.digest(row)) for row in market_data)
+        return books, self.digest(game_info), link
+
+    def rescan(self, changed_view, sport, **kwargs):
+        if self.columnar:
+            return Datafetcher.find_ev_columnar(changed_view, sport, by_market=True, **kwargs)
+        market_rows = {}
+        for game, game_data in changed_view.items():
+            for period, period_data in game_data.items():
+                if period == 'info' or period == 'link':
+                    continue
+                for market_name, market_data in period_data.items():
+                    market_view = {game: {period: {market_name: market_data}}}
+                    for key in ('info', 'link'):
+                        if key in game_data:
+                            market_view[game][key] = game_data[key]
+                    rows, _ = Datafetcher.find_ev(market_view, sport, **kwargs)
+                    market_rows[(game, period, market_name)] = rows
+        return market_rows
+
+    def scan(self, data, sport, **kwargs):
+        scan_args = (sport, tuple(sorted(kwargs.items())))
+        if scan_args != self.scan_args:
+            self.fingerprints, self.rows = {}, {}
+            self.scan_args = scan_args
+
+        fingerprints = {}
+        changed_view = {}
+        changed = []
+        for game, game_data in data.items():
+            link = game_data.get('link')
+            game_info = game_data.get('info', {})
+            for period, period_data in game_data.items():
+                if period == 'info' or period == 'link':
+                    continue
+                for market_name, market_data in period_data.items():
+                    key = (game, period, market_name)
+                    fingerprint = self.fingerprint(market_data, game_info, link)
+                    fingerprints[key] = fingerprint
+                    if self.fingerprints.get(key) == fingerprint:
+                        continue
+                    changed.append(key)
+                    changed_game = changed_view.setdefault(game, {})
+                    changed_game.setdefault(period, {})[market_name] = market_data
+                    for extra in ('info', 'link'):
+                        if extra in game_data:
+                            changed_game[extra] = game_data[extra]
+
+        rescanned = self.rescan(changed_view, sport, **kwargs) if changed_view else {}
+        market_rows = {}
+        for key in fingerprints:
+            if key in self.rows and self.fingerprints.get(key) == fingerprints[key]:
+                market_rows[key] = self.rows[key]
+            else:
+                market_rows[key] = rescanned.get(key, [])
+
+        self.fingerprints = fingerprints
+        self.rows = market_rows
+        self.last_changed, self.last_total = len(changed), len(market_rows)
+
+        rows = [row for rows in market_rows.values() for row in rows]
+        return sort_dicts_by_key(rows, 'ev'), []
 
 
 async def main():
     d = Datafetcher('basketball', live=False)
     await d.post_init()
-    p = await Pinnacle.create('basketball', 'odds_user', 'odds_password')
-
-    while True:
-        with open('pings.json', 'r') as f:
-            old_pings = json.load(f)
-        current_date = datetime.now().strftime('%Y-%m-%d')
-        data = await d.run()
-        with open('data.json', 'w') as f:
-            json.dump(data, f, indent=4)
-
-        ev, ld = Datafetcher.find_ev(data, 'basketball', sharp_name='pin', need_timeout=False, ev_threshold=-100,
-                                     spread_threshold=1.5, total_threshold=1.5, half_threshold=1.5)
-        for e in ev:
-            if e['ev'] > 2:
-                print(e)
-                bet_key = f'{e["game_info"]["sql_key"]} {e["market"]} {e["bet"]} {current_date}'
-                if bet_key in old_pings:
-                    continue
-                history = await p.get_odds_history(e['game_info']['sql_key'], e['market'], f'full:{e["market"]}:{e["num"]}')
-                history.reverse()
-                send_graph(history, f'{e["bet"]} {e["odds"]}', f'{e["game"]}:{e["market"]}:{e["num"]}',
-                            f'ev: {e["ev"]} qk: {e["qk"]} \n'
-                            f'pin: {e["sharp_odds"]} \n'
-                            f'max: {e["limit"]:.0f}', f'{e["game"]}: \n{e["game_info"]["league"]}', e["side"], e["link"], False)
+    scanner = IncrementalScanner(columnar=columnar_scan)
+    p = next(book for book in d.books if book.name == 'pin')
+
+    try:
+        while True:
+            with open('pings.json', 'r') as f:
+                old_pings = json.load(f)
+            current_date = datetime.now().strftime('%Y-%m-%d')
+            data = await d.run()
+            with open('data.json', 'w') as f:
+                json.dump(data, f, indent=4)
+
+            ev, ld = scanner.scan(data, 'basketball', sharp_name='pin', need_timeout=False, ev_threshold=-100,
+                                  spread_threshold=1.5, total_threshold=1.5, half_threshold=1.5)
+            print(f"Rescanned {scanner.last_changed}/{scanner.last_total} markets")
+            print(f"Devig cache: {devig_cache.info()}")
+            if p.persister is not None:
+                print(f"Persister: {p.persister.info()}")
+            print(f"History store: {p.history.info()}")
+            alerts = {}
+            for e in ev:
+                if e['ev'] > 2:
+                    print(e)
+                    bet_key = f'{e["game_info"]["sql_key"]} {e["market"]} {e["bet"]} {current_date}'
+                    if bet_key in old_pings or bet_key in alerts:
+                        continue
+                    alerts[bet_key] = (e, (int(e['game_info']['sql_key']), e['market'], f'full:{e["market"]}:{e["num"]}'))
+            # Histories of every alert of the cycle, from memory for markets already tracked
+            histories = await p.get_history_arrays([key for _, key in alerts.values()])
+            for bet_key, (e, key) in alerts.items():
+                await send_graph(histories[key], f'{e["bet"]} {e["odds"]}', f'{e["game"]}:{e["market"]}:{e["num"]}',
+                                  f'ev: {e["ev"]} qk: {e["qk"]} \n'
+                                  f'pin: {e["sharp_odds"]} \n'
+                                  f'max: {e["limit"]:.0f}', f'{e["game"]}: \n{e["game_info"]["league"]}', e["side"], e["link"], False)
                 old_pings.append(bet_key)
-        with open('pings.json', 'w') as f:
-            json.dump(old_pings, f, indent=4)
+            with open('pings.json', 'w') as f:
+                json.dump(old_pings, f, indent=4)
+    finally:
+        # Flush queued database writes before exiting, then close the shared HTTP client's connections
+        await p.close()
+        await transport.aclose()
 
 
 
@@ -0,0 +1,300 @@
+import argparse
+
+import psycopg2
+
+# Ordered (version, description, sql). Applied versions are recorded in schema_version; never edit a migration that
+# has shipped, add a new one instead.
+MIGRATIONS = [
+    (1, 'baseline tables', """
+    CREATE TABLE IF NOT EXISTS bookmakers (
+        bookmaker_id SERIAL PRIMARY KEY,
+        name TEXT UNIQUE,
+        website TEXT,
+        created_at TIMESTAMP WITH TIME ZONE,
+        updated_at TIMESTAMP WITH TIME ZONE
+    );
+
+    CREATE TABLE IF NOT EXISTS events (
+        event_id SERIAL PRIMARY KEY,
+        sport TEXT,
+        league TEXT,
+        home_team TEXT,
+        away_team TEXT,
+        start_time TIMESTAMP WITH TIME ZONE,
+        external_event_id TEXT UNIQUE,
+        is_timeout BOOLEAN DEFAULT FALSE,
+        created_at TIMESTAMP WITH TIME ZONE,
+        updated_at TIMESTAMP WITH TIME ZONE
+    );
+
+    CREATE TABLE IF NOT EXISTS markets (
+        market_id SERIAL PRIMARY KEY,
+        event_id INTEGER REFERENCES events(event_id),
+        bookmaker_id INTEGER REFERENCES bookmakers(bookmaker_id),
+        market_type TEXT,
+        selection TEXT,
+        created_at TIMESTAMP WITH TIME ZONE,
+        updated_at TIMESTAMP WITH TIME ZONE
+    );
+
+    CREATE TABLE IF NOT EXISTS current_odds (
+        market_id INTEGER PRIMARY KEY REFERENCES markets(market_id),
+        odds TEXT,
+        last_updated TIMESTAMP WITH TIME ZONE
+    );
+
+    CREATE TABLE IF NOT EXISTS odds_history (
+        history_id SERIAL PRIMARY KEY,
+        market_id INTEGER REFERENCES markets(market_id),
+        old_odds TEXT,
+        new_odds TEXT,
+        changed_at TIMESTAMP WITH TIME ZONE
+    );
+    """),
+
+    (2, 'limit tables and markets natural key', """
+    CREATE TABLE IF NOT EXISTS current_limits (
+        market_id INTEGER PRIMARY KEY REFERENCES markets(market_id),
+        max_limit DOUBLE PRECISION,
+        last_updated TIMESTAMP WITH TIME ZONE
+    );
+
+    CREATE TABLE IF NOT EXISTS limit_history (
+        limit_history_id SERIAL PRIMARY KEY,
+        market_id INTEGER REFERENCES markets(market_id),
+        old_limit DOUBLE PRECISION,
+        new_limit DOUBLE PRECISION,
+        changed_at TIMESTAMP WITH TIME ZONE
+    );
+
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'markets_natural_key') THEN
+            ALTER TABLE markets ADD CONSTRAINT markets_natural_key
+                UNIQUE (event_id, bookmaker_id, market_type, selection);
+        END IF;
+    END $$;
+    """),
+
+    (3, 'history partition functions', """
+    -- Daily partitions are named <table>_YYYYMMDD and cover that UTC day
+    CREATE OR REPLACE FUNCTION ensure_history_partitions(days_ahead INTEGER DEFAULT 7, from_day DATE DEFAULT NULL)
+    RETURNS INTEGER AS $$
+    DECLARE
+        parent TEXT;
+        day DATE;
+        today DATE := (now() AT TIME ZONE 'UTC')::date;
+        partition TEXT;
+        created INTEGER := 0;
+    BEGIN
+        FOREACH parent IN ARRAY ARRAY['odds_history', 'limit_history'] LOOP
+            FOR day IN SELECT generate_series(COALESCE(from_day, today - 1), today + days_ahead, '1 day')::date LOOP
+                partition := parent || '_' || to_char(day, 'YYYYMMDD');
+                IF to_regclass(partition) IS NULL THEN
+                    EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)', partition, parent,
+                                   day::timestamp AT TIME ZONE 'UTC', (day + 1)::timestamp AT TIME ZONE 'UTC');
+                    created := created + 1;
+                END IF;
+            END LOOP;
+        END LOOP;
+        RETURN created;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    -- Retention: detach and drop history partitions for days older than retain_days
+    CREATE OR REPLACE FUNCTION drop_history_partitions(retain_days INTEGER DEFAULT 30)
+    RETURNS INTEGER AS $$
+    DECLARE
+        part RECORD;
+        cutoff DATE := (now() AT TIME ZONE 'UTC')::date - retain_days;
+        dropped INTEGER := 0;
+    BEGIN
+        FOR part IN
+            SELECT c.relname AS name, p.relname AS parent
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            WHERE p.relname IN ('odds_history', 'limit_history')
+                AND c.relname ~ '_[0-9]{8}$'
+                AND to_date(right(c.relname, 8), 'YYYYMMDD') < cutoff
+        LOOP
+            EXECUTE format('ALTER TABLE %I DETACH PARTITION %I', part.parent, part.name);
+            EXECUTE format('DROP TABLE %I', part.name);
+            dropped := dropped + 1;
+        END LOOP;
+        RETURN dropped;
+    END;
+    $$ LANGUAGE plpgsql;
+    """),
+
+    (4, 'partition history tables by day', """
+    ALTER TABLE odds_history RENAME TO odds_history_legacy;
+    ALTER SEQUENCE odds_history_history_id_seq RENAME TO odds_history_legacy_history_id_seq;
+    ALTER TABLE limit_history RENAME TO limit_history_legacy;
+    ALTER SEQUENCE limit_history_limit_history_id_seq RENAME TO limit_history_legacy_limit_history_id_seq;
+
+    -- Partition keys must be part of any unique index, so the ids are no longer primary keys
+    CREATE TABLE odds_history (
+        history_id BIGSERIAL,
+        market_id INTEGER REFERENCES markets(market_id),
+        old_odds TEXT,
+        new_odds TEXT,
+        changed_at TIMESTAMP WITH TIME ZONE NOT NULL
+    ) PARTITION BY RANGE (changed_at);
+
+    CREATE TABLE limit_history (
+        limit_history_id BIGSERIAL,
+        market_id INTEGER REFERENCES markets(market_id),
+        old_limit DOUBLE PRECISION,
+        new_limit DOUBLE PRECISION,
+        changed_at TIMESTAMP WITH TIME ZONE NOT NULL
+    ) PARTITION BY RANGE (changed_at);
+
+    CREATE INDEX odds_history_changed_at_brin ON odds_history USING BRIN (changed_at);
+    CREATE INDEX odds_history_market_changed_at ON odds_history (market_id, changed_at);
+    CREATE INDEX limit_history_changed_at_brin ON limit_history USING BRIN (changed_at);
+    CREATE INDEX limit_history_market_changed_at ON limit_history (market_id, changed_at);
+
+    SELECT ensure_history_partitions(7, LEAST(
+        (SELECT min(changed_at AT TIME ZONE 'UTC')::date FROM odds_history_legacy),
+        (SELECT min(changed_at AT TIME ZONE 'UTC')::date FROM limit_history_legacy)
+    ));
+
+    INSERT INTO odds_history (history_id, market_id, old_odds, new_odds, changed_at)
+    SELECT history_id, market_id, old_odds, new_odds, changed_at FROM odds_history_legacy
+    WHERE changed_at IS NOT NULL;
+    INSERT INTO limit_history (limit_history_id, market_id, old_limit, new_limit, changed_at)
+    SELECT limit_history_id, market_id, old_limit, new_limit, changed_at FROM limit_history_legacy
+    WHERE changed_at IS NOT NULL;
+
+    SELECT setval('odds_history_history_id_seq', COALESCE((SELECT max(history_id) FROM odds_history), 0) + 1, false);
+    SELECT setval('limit_history_limit_history_id_seq',
+                  COALESCE((SELECT max(limit_history_id) FROM limit_history), 0) + 1, false);
+
+    DROP TABLE odds_history_legacy;
+    DROP TABLE limit_history_legacy;
+    """),
+
+    (5, 'typed odds columns', """
+    -- Odds used to be text: "<odds>" for moneylines, "<one>,<two>,<alt>" for spreads and totals
+    CREATE FUNCTION pg_temp.odds_side(odds TEXT, side INTEGER) RETURNS SMALLINT AS $$
+        SELECT CASE WHEN split_part(odds, ',', side) ~ '^-?[0-9]+(\\.[0-9]+)?$'
+            THEN LEAST(GREATEST(split_part(odds, ',', side)::numeric, -32767), 32767)::smallint END
+    $$ LANGUAGE sql IMMUTABLE;
+    CREATE FUNCTION pg_temp.odds_alt(odds TEXT) RETURNS BOOLEAN AS $$
+        SELECT CASE WHEN split_part(odds, ',', 3) IN ('True', 'False') THEN split_part(odds, ',', 3) = 'True' END
+    $$ LANGUAGE sql IMMUTABLE;
+    CREATE FUNCTION pg_temp.selection_line(market_type TEXT, selection TEXT) RETURNS NUMERIC AS $$
+        SELECT CASE WHEN market_type IN ('spread', 'total') AND split_part(selection, ':', 3) ~ '^-?[0-9]+(\\.[0-9]+)?$'
+            THEN split_part(selection, ':', 3)::numeric END
+    $$ LANGUAGE sql IMMUTABLE;
+
+    ALTER TABLE current_odds
+        ADD COLUMN one SMALLINT,
+        ADD COLUMN two SMALLINT,
+        ADD COLUMN alt BOOLEAN,
+        ADD COLUMN line NUMERIC;
+    UPDATE current_odds c SET
+        one = pg_temp.odds_side(c.odds, 1),
+        two = pg_temp.odds_side(c.odds, 2),
+        alt = pg_temp.odds_alt(c.odds),
+        line = pg_temp.selection_line(m.market_type, m.selection)
+    FROM markets m
+    WHERE m.market_id = c.market_id;
+    ALTER TABLE current_odds DROP COLUMN odds;
+
+    ALTER TABLE odds_history
+        ADD COLUMN old_one SMALLINT,
+        ADD COLUMN old_two SMALLINT,
+        ADD COLUMN new_one SMALLINT,
+        ADD COLUMN new_two SMALLINT,
+        ADD COLUMN alt BOOLEAN,
+        ADD COLUMN line NUMERIC;
+    UPDATE odds_history h SET
+        old_one = pg_temp.odds_side(h.old_odds, 1),
+        old_two = pg_temp.odds_side(h.old_odds, 2),
+        new_one = pg_temp.odds_side(h.new_odds, 1),
+        new_two = pg_temp.odds_side(h.new_odds, 2),
+        alt = pg_temp.odds_alt(h.new_odds),
+        line = pg_temp.selection_line(m.market_type, m.selection)
+    FROM markets m
+    WHERE m.market_id = h.market_id;
+    ALTER TABLE odds_history DROP COLUMN old_odds, DROP COLUMN new_odds;
+    """),
+]
+
+
+def get_connection():
+    return psycopg2.connect(
+        dbname="odds_data_db",
+        user="odds_user",
+        password="odds_password",
+        host="localhost",
+        port=5432
+    )
+
+
+def migrate(conn):
+    """
+    Apply every migration newer than the database's schema_version, each in its own transaction.
+
+    :return: List of versions applied
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+        )
+        """)
+        cur.execute("SELECT COALESCE(max(version), 0) FROM schema_version")
+        current = cur.fetchone()[0]
+    conn.commit()
+
+    applied = []
+    for version, description, sql in MIGRATIONS:
+        if version <= current:
+            continue
+        try:
+            with conn.cursor() as cur:
+                cur.execute(sql)
+                cur.execute("INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                            (version, description))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            print(f"Migration {version} ({description}) failed")
+            raise
+        print(f"Applied migration {version}: {description}")
+        applied.append(version)
+    return applied
+
+
+def run_retention(conn, retain_days=30, days_ahead=7):
+    """
+    Create upcoming history partitions and drop the ones older than retain_days. Meant to run daily.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT ensure_history_partitions(%s)", (days_ahead,))
+        created = cur.fetchone()[0]
+        cur.execute("SELECT drop_history_partitions(%s)", (retain_days,))
+        dropped = cur.fetchone()[0]
+    conn.commit()
+    print(f"Created {created} and dropped {dropped} history partitions")
+    return created, dropped
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Database migrations and history retention')
+    parser.add_argument('step', choices=['migrate', 'retention'], nargs='?', default='migrate')
+    parser.add_argument('--retain-days', type=int, default=30)
+    args = parser.parse_args()
+    conn = get_connection()
+    try:
+        if args.step == 'migrate':
+            migrate(conn)
+        else:
+            run_retention(conn, args.retain_days)
+    finally:
+        conn.close()
@@ -1,17 +1,15 @@
-import requests
 import matplotlib
 
 
 
 import numpy as np
-from tools.devig import dec_to_amer, calculate_decimal_odds
+from tools.odds import amer_to_imp, amer_to_imp_array, imp_to_amer
+from tools.transport import transport
 import io
-import httpx
 import time
 import discord
 import json
 
-session = httpx.AsyncClient()
 matplotlib.use('Agg')
 
 from matplotlib.ticker import FuncFormatter
@@ -19,41 +17,34 @@ import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 
 def imp_to_american(imp):
-    dec = 1 / -imp
-    return dec_to_amer(dec)
+    return imp_to_amer(-imp)
 
 
 def american_to_imp(american):
-    return -1 / calculate_decimal_odds(american)
+    return -amer_to_imp(american)
 
 
 def graph(history, graph_title, side):
     fig, ax = plt.subplots()
 
-    odds_times = []
-    limit_times = []
-    odds = []
-    limits = []
-
-    for change in history:
-        if change['type'] == 'odds':
-            odds_times.append(change['changed_at'])
-            odds_values = change['new_value'].split(',')
-            if side == 'one':
-                change_odds = float(odds_values[0])
-            else:
-                change_odds = float(odds_values[1])
-            # Convert to implied probability and then to internal representation
-            imp = 1 / calculate_decimal_odds(change_odds)
-            odds.append(-imp)
-        elif change['type'] == 'limit':
-            limit_times.append(change['changed_at'])
-            limit = float(change['new_value'])
-            limits.append(limit)
+    # history: (ts, one, two, limit) rows oldest first, NaN where a row doesn't change that column
+    ts, one, two, limit = np.asarray(history, dtype=float).reshape(-1, 4).T
+    values = one if side == 'one' else two
+    is_limit = ~np.isnan(limit)
+    is_odds = ~is_limit & ~np.isnan(values)
+    times = (ts * 1e6).astype('int64').astype('datetime64[us]').astype(object)
+
+    odds_times = times[is_odds].tolist()
+    odds = values[is_odds].tolist()
+    limit_times = times[is_limit].tolist()
+    limits = limit[is_limit].tolist()
 
     if len(odds_times) < 2:
         return None
 
+    # Convert to implied probability and then to internal representation
+    odds = (-amer_to_imp_array(odds)).tolist()
+
     max_time = max(odds_times + limit_times)
     if max_time not in limit_times and len(limits) > 0:
         limit_times.append(max_time)
@@ -105,7 +96,7 @@ def graph(history, graph_title, side):
     return buf.getvalue()
 
 
-def send_graph(history, embed_text, graph_title, embed_subtext, game, side, link, test=False):
+async def send_graph(history, embed_text, graph_title, embed_subtext, game, side, link, test=False):
     webhook_url = 'https://discord.com/api/webhooks/1318079744645795900/W9mZH7SWlh1WrSodBysikKTyAXWj7EHDonF58pBzX6f9eXfjkkFQFoi5LQO1AnmQsuTN'
     if test:
         webhook_url = 'https://discordapp.com/api/webhooks/1242191264502517870/q3zp3NvnBdOuM3NDqDAl5-mMu13bJpYlGSHVu7_EFJCGH5roOY9PI6w_k2SPhVqq1MNl'
@@ -143,13 +134,13 @@ def send_graph(history, embed_text, graph_title, embed_subtext, game, side, link
 
     # Post request with multipart form-data
     files = {
-        "files[0]": ("graph.png", io.BytesIO(image), "image/png")
+        "files[0]": ("graph.png", image, "image/png")
     }
     data = {
         "payload_json": json.dumps(payload)
     }
     t = time.time()
-    response = requests.post(webhook_url, data=data, files=files)
+    response = await transport.post(webhook_url, data=data, files=files)
     print(f"Time taken to send message: {time.time() - t:.2f}s")
     if response.status_code == 200:
         print("Message sent successfully.")
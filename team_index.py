@@ -0,0 +1,167 @@
+import json
+import os
+import sys
+import threading
+import time
+
+from rapidfuzz import process, fuzz
+
+from clean import clean_name, clean_names
+
+
+class TeamIndex:
+    """
+    Resolves book league and team names to Pinnacle names through plain dicts built once from
+    league_name_map.json and jsons/team_names.json.
+
+    Teams are keyed by (league, name) twice: once lower-cased, which matches the old CaseInsensitiveDict lookups, and
+    once through clean_name as a fallback. Cleaned keys that would map to two different teams are left out. start()
+    watches both files and swaps in a freshly built index when either one's mtime changes.
+    """
+    def __init__(self, league_path='league_name_map.json', team_path='jsons/team_names.json', interval=5):
+        self.league_path = league_path
+        self.team_path = team_path
+        self.interval = interval
+        self.snapshot = self.build()
+        self.watcher = None
+
+    def mtimes(self):
+        return os.path.getmtime(self.league_path), os.path.getmtime(self.team_path)
+
+    def build(self):
+        mtimes = self.mtimes()
+        with open(self.league_path, 'r') as f:
+            league_map = json.load(f)
+        with open(self.team_path, 'r') as f:
+            team_map = json.load(f)
+
+        leagues = {raw.lower(): sys.intern(league) for raw, league in league_map.items()}
+        teams = {}
+        cleaned = {}
+        ambiguous = set()
+        for league, names in team_map.items():
+            league = sys.intern(league.lower())
+            for raw, team in names.items():
+                team = sys.intern(team)
+                teams.setdefault((league, raw.lower()), team)
+                key = (league, clean_name(raw))
+                if cleaned.setdefault(key, team) != team:
+                    ambiguous.add(key)
+        for key in ambiguous:
+            del cleaned[key]
+        league_teams = {league.lower() for league, names in team_map.items() if names}
+        return mtimes, leagues, teams, cleaned, league_teams
+
+    def league(self, raw_league):
+        return self.snapshot[1].get(raw_league.lower())
+
+    def has_teams(self, league):
+        return league.lower() in self.snapshot[4]
+
+    def team(self, league, raw_team):
+        _, _, teams, cleaned, _ = self.snapshot
+        league = league.lower()
+        team = teams.get((league, raw_team.lower()))
+        if team is None:
+            team = cleaned.get((league, clean_name(raw_team)))
+        return team
+
+    def reload_if_changed(self):
+        try:
+            if self.mtimes() == self.snapshot[0]:
+                return False
+            snapshot = self.build()
+        except (OSError, ValueError) as e:
+            # Most likely caught a file mid-write; keep the current index and retry on the next tick
+            print(f'Team index reload failed: {e}')
+            return False
+        self.snapshot = snapshot
+        print('Team index reloaded')
+        return True
+
+    def watch(self):
+        while True:
+            time.sleep(self.interval)
+            self.reload_if_changed()
+
+    def start(self):
+        if self.watcher is None:
+            self.watcher = threading.Thread(target=self.watch, name='team-index-watcher', daemon=True)
+            self.watcher.start()
+        return self
+
+
+class FuzzyTeamResolver:
+    """
+    Fallback for team names the TeamIndex misses: fuzzy-matches them against the Pinnacle teams of the same league
+    seen in the current cycle.
+
+    Only confident, unambiguous matches are accepted. Matches are cached for ttl seconds and misses for miss_ttl, so a
+    miss costs one fuzzy search per miss_ttl rather than one per cycle; nothing is cached while the league has no
+    Pinnacle teams (startup, failed poll). Accepted matches are appended to log_path as JSON lines for promotion into
+    jsons/team_names.json.
+    """
+    def __init__(self, min_score=92, min_margin=5, ttl=900, miss_ttl=60, log_path='jsons/learned_team_names.jsonl'):
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self.log_path = log_path
+        self.leagues = {}
+        self.decisions = {}
+
+    def index_pinnacle(self, pin_data):
+        """
+        Rebuild the per-league choice lists from this cycle's Pinnacle games.
+        """
+        teams = {}
+        for game_name, game_data in pin_data.items():
+            league = game_data.get('info', {}).get('league')
+            if not league:
+                continue
+            try:
+                teams.setdefault(league.lower(), set()).update(game_name.title().split(' @ '))
+            except AttributeError:
+                continue
+        leagues = {}
+        for league, names in teams.items():
+            names = sorted(names)
+            leagues[league] = (names, clean_names(names))
+        self.leagues = leagues
+        now = time.monotonic()
+        self.decisions = {key: decision for key, decision in self.decisions.items() if decision[1] > now}
+
+    def resolve(self, league, raw_team):
+        key = (league.lower(), raw_team.lower())
+        now = time.monotonic()
+        decision = self.decisions.get(key)
+        if decision is not None and decision[1] > now:
+            return decision[0]
+
+        if key[0] not in self.leagues:
+            # No Pinnacle teams to match against this cycle; try again next cycle
+            return None
+        team, score = self.search(key[0], raw_team)
+        self.decisions[key] = (team, now + (self.ttl if team is not None else self.miss_ttl))
+        if team is not None:
+            self.learn(league, raw_team, team, score)
+        return team
+
+    def search(self, league, raw_team):
+        names, cleaned = self.leagues.get(league, ((), ()))
+        if not names:
+            return None, 0
+        matches = process.extract(clean_name(raw_team), cleaned, scorer=fuzz.token_set_ratio, limit=2)
+        best_score, best = matches[0][1], matches[0][2]
+        runner_up = matches[1][1] if len(matches) > 1 else 0
+        if best_score >= self.min_score and best_score - runner_up >= self.min_margin:
+            return names[best], best_score
+        return None, best_score
+
+    def learn(self, league, raw_team, team, score):
+        print(f'Learned team name {raw_team} -> {team}, {league} ({score:.0f})')
+        try:
+            with open(self.log_path, 'a') as f:
+                f.write(json.dumps({'league': league, 'team': raw_team, 'match': team, 'score': round(score, 1)}) + '\n')
+        except OSError as e:
+            print(f'Could not log learned team name: {e}')
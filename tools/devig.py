@@ -1,54 +1,70 @@
+from collections import OrderedDict
+
 import numpy as np
-from scipy.optimize import root
 
+from tools.odds import amer_to_dec, amer_to_dec_array, amer_to_imp, dec_to_amer, dec_to_amer_array
 
-def dec_to_amer(dec):
-    if not dec:
-        return None
-    if dec >= 2:
-        amer = (dec - 1) * 100
-    else:
-        amer = (-100) / (dec - 1)
-    return int(amer)
+calculate_decimal_odds = amer_to_dec
 
 
-def calculate_decimal_odds(odds):
-    if not odds:
-        return None
-    odds = float(odds)
-    if odds == 100:
-        p1dec = 2
-    elif odds > 0:
-        p1dec = (odds / 100) + 1
-    else:
-        odds = -1 * odds
-        p1dec = (100 / odds) + 1
-    return p1dec
+def devig_power(odds):
+    odds = [calculate_decimal_odds(i) for i in odds]
+    return devig_power_dec(odds)
 
 
-def devig_power(odds):
-    def pwr_func(nn, io):
-        return io ** (1 / nn)
+def solve_power_exponents(inverted_odds, tol=1e-14, max_iter=50):
+    """
+    Solve sum(io ** k) = 1 for k on every row of inverted_odds at once.
 
-    odds = np.array([[calculate_decimal_odds(i) for i in odds]])
-    n_odds, n_outcomes = odds.shape
-    probs = np.zeros((n_odds, n_outcomes))
-    fairOdds = np.empty((n_odds, n_outcomes))
+    f(k) = sum(io ** k) - 1 is convex and decreasing in k, so Newton steps
+    converge monotonically once they are left of the root. Starting from k = 1
+    that is already the case for any market with vig; an underround market
+    overshoots left on the first step, which is kept positive by halving.
 
-    exponents = np.zeros(n_odds)
-    inverted_odds = 1 / odds
+    :param inverted_odds: (M x N) array of implied probabilities (1 / decimal odds)
+    :return: Array of M exponents k, so that the fair probabilities are io ** k
+    """
+    log_io = np.log(inverted_odds)
+    k = np.ones(inverted_odds.shape[0])
+    active = np.ones(inverted_odds.shape[0], dtype=bool)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        for _ in range(max_iter):
+            powered = inverted_odds ** k[:, None]
+            f = powered.sum(axis=1) - 1
+            df = (powered * log_io).sum(axis=1)
+            new_k = k - f / df
+            new_k = np.where(new_k > 0, new_k, k / 2)
+            new_k = np.where(np.isfinite(new_k), new_k, k)
+            converged = np.abs(new_k - k) <= tol * new_k
+            # Rows stop moving once converged, so a market devigs to the same
+            # bits whether it is solved alone or inside a batch.
+            k = np.where(active, new_k, k)
+            active &= ~converged
+            if not active.any():
+                break
+    return k
+
+
+def devig_batch(odds):
+    """
+    Devig M markets of N outcomes each in one go.
 
-    for ii in range(n_odds):
-        def pwr_solvefor(nn, io):
-            tmp = pwr_func(nn, io)
-            return np.sum(tmp) - 1
+    :param odds: (M x N) array of decimal odds, one market per row
+    :return: (power, mult, worst) arrays of American fair odds, each (M x N).
+        worst is the element-wise max of the power and multiplicative methods.
+    """
+    odds = np.asarray(odds, dtype=float)
+    if odds.ndim == 1:
+        odds = odds[None, :]
+    inverted_odds = 1 / odds
 
-        res = root(fun=pwr_solvefor, x0=0.5, args=(inverted_odds[ii,]))  # Using 0.5 as initial guess
-        exponents[ii] = res.x
-        probs[ii, :] = pwr_func(nn=res.x, io=inverted_odds[ii,])
-        fairOdds[ii, :] = [dec_to_amer(1 / i) for i in pwr_func(nn=res.x, io=inverted_odds[ii,])]
+    k = solve_power_exponents(inverted_odds)
+    power_probs = inverted_odds ** k[:, None]
+    mult_probs = inverted_odds / inverted_odds.sum(axis=1, keepdims=True)
 
-    return fairOdds[0]
+    power = dec_to_amer_array(1 / power_probs)
+    mult = dec_to_amer_array(1 / mult_probs)
+    return power, mult, np.maximum(power, mult)
 
 
 def calculate_ev(odds, fair_value):
@@ -62,11 +78,8 @@ def calculate_ev(odds, fair_value):
     # Convert American odds to implied probability
     if odds == 'N/A':
         return None, None
-    if fair_value > 0:
-        fair_value = 100 / (fair_value + 100)
-    else:
-        fair_value = -fair_value / (-fair_value + 100)
-    dec = calculate_decimal_odds(odds)
+    fair_value = amer_to_imp(fair_value)
+    dec = amer_to_dec(odds)
 
     ev = ((dec - 1) * fair_value) - ((1 - fair_value))
     qk = kelly_criterion(dec, fair_value)
@@ -93,44 +106,89 @@ def kelly_criterion(odds, probability_of_winning):
 
 
 
+class LRUCache:
+    """
+    Size-bounded least-recently-used cache with hit/miss/eviction counters.
+    """
+    def __init__(self, maxsize=8192):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        try:
+            value = self.data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.data.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def info(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self.data),
+            'maxsize': self.maxsize,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+devig_cache = LRUCache()
+_missing = object()
+
+
+def amer_key(odds):
+    """
+    Normalize a list of American odds (ints, floats or strings) into a hashable
+    tuple, using ints wherever the price is integral so -110, -110.0 and '-110'
+    share one cache entry.
+    """
+    key = []
+    for odd in odds:
+        odd = float(odd)
+        key.append(int(odd) if odd.is_integer() else odd)
+    return tuple(key)
+
+
 def worst_case_dec(odds):
-    power = devig_power_dec(odds)[0]
-    mult = devig_mult_dec(odds)
-    if power > mult:
-        return power
-    return mult
+    key = ('dec',) + tuple(float(odd) for odd in odds)
+    fair = devig_cache.get(key, _missing)
+    if fair is _missing:
+        fair = devig_batch([odds])[2][0, 0]
+        devig_cache.put(key, fair)
+    return fair
 
 def worst_case_amer(odds):
-    odds = [calculate_decimal_odds(odd) for odd in odds]
-    return worst_case_dec(odds)
+    key = amer_key(odds)
+    fair = devig_cache.get(key, _missing)
+    if fair is _missing:
+        fair = devig_batch(amer_to_dec_array([key]))[2][0, 0]
+        devig_cache.put(key, fair)
+    return fair
 
 def worst_case_amer_to_dec(odds):
-    odds = [calculate_decimal_odds(odd) for odd in odds]
-    return calculate_decimal_odds(worst_case_dec(odds))
+    return calculate_decimal_odds(worst_case_amer(odds))
 
 
 def devig_power_dec(odds):
-    def pwr_func(nn, io):
-        return io ** (1 / nn)
-
-    odds = np.array([[i for i in odds]])
-    n_odds, n_outcomes = odds.shape
-    probs = np.zeros((n_odds, n_outcomes))
-    fairOdds = np.empty((n_odds, n_outcomes))
-
-    exponents = np.zeros(n_odds)
-    inverted_odds = 1 / odds
-
-    for ii in range(n_odds):
-        def pwr_solvefor(nn, io):
-            tmp = pwr_func(nn, io)
-            return np.sum(tmp) - 1
-
-        res = root(fun=pwr_solvefor, x0=0.5, args=(inverted_odds[ii,]))  # Using 0.5 as initial guess
-        exponents[ii] = res.x
-        probs[ii, :] = pwr_func(nn=res.x, io=inverted_odds[ii,])
-        fairOdds[ii, :] = [dec_to_amer(1 / i) for i in pwr_func(nn=res.x, io=inverted_odds[ii,])]
-    return fairOdds[0]
+    return devig_batch([odds])[0][0]
 
 
 def devig_mult_dec(odds):
@@ -142,8 +200,7 @@ def devig_mult_dec(odds):
 def calculate_vig(odds: list):
     total = 0
     for odd in odds:
-        imp = 1/calculate_decimal_odds(int(odd))
-        total += imp
+        total += amer_to_imp(int(odd))
     return total
 
 def hit():
@@ -1,7 +1,7 @@
 import hashlib
 import time
 
-import httpx
+from tools.transport import transport
 
 timeout_url = 'https://discordapp.com/api/webhooks/1203781932815618108/7FbLFBN4ym0_sqjTJ_zMGteBh6f4x03jXukJvwbCB2YfxGChAHWhZ6kG-g4KvamSt7vP'
 czr_url = 'https://discordapp.com/api/webhooks/1242189166369046678/fCP0KTt4VQ0vVR4UeEZoTTOnuzqgmeV8dNWAf2iRjmAi9zX2ZjseOCmFv53jYE_XGKc-'
@@ -24,7 +24,7 @@ webhook_mapping = {
     'mcdanglez': mcdanglez_url
 }
 
-client = httpx.AsyncClient()
+client = transport
 
 # Dictionary to track the last sent time and hash of the message for each channel
 last_sent_data = {}
@@ -0,0 +1,110 @@
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+
+# Columns of a history row; odds changes leave LIMIT as NaN and limit changes leave ONE and TWO as NaN
+TS, ONE, TWO, LIMIT = range(4)
+
+
+def history_row(changed_at, one=None, two=None, limit=None):
+    """
+    :param changed_at: datetime or unix timestamp
+    """
+    if isinstance(changed_at, datetime):
+        changed_at = changed_at.timestamp()
+    return [changed_at] + [np.nan if value is None else value for value in (one, two, limit)]
+
+
+class RingBuffer:
+    """
+    Fixed-capacity array of (ts, one, two, limit) rows; once full, each append overwrites the oldest row.
+    """
+    def __init__(self, capacity):
+        self.data = np.full((capacity, 4), np.nan)
+        self.start = 0
+        self.size = 0
+
+    def append(self, row):
+        capacity = len(self.data)
+        self.data[(self.start + self.size) % capacity] = row
+        if self.size < capacity:
+            self.size += 1
+        else:
+            self.start = (self.start + 1) % capacity
+
+    def extend(self, rows):
+        # Only the last capacity rows can survive
+        for row in rows[-len(self.data):]:
+            self.append(row)
+
+    def array(self):
+        """
+        Copy of the rows, oldest first.
+        """
+        return self.data[(self.start + np.arange(self.size)) % len(self.data)]
+
+
+class HistoryStore:
+    """
+    In-memory odds/limit history of the markets being looked at, one RingBuffer per market_id.
+
+    A market is tracked once it has been seeded with its history from the database; from then on the ingest path
+    records its changes. Beyond max_markets the least recently read market is dropped.
+    """
+    def __init__(self, capacity=512, max_markets=2048):
+        self.capacity = capacity
+        self.max_markets = max_markets
+        self.buffers = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, market_id):
+        return market_id in self.buffers
+
+    def get(self, market_id):
+        """
+        (n, 4) array of the market's rows oldest first, or None if it isn't tracked.
+        """
+        buffer = self.buffers.get(market_id)
+        if buffer is None:
+            self.misses += 1
+            return None
+        self.buffers.move_to_end(market_id)
+        self.hits += 1
+        return buffer.array()
+
+    def seed(self, market_id, rows):
+        """
+        Start tracking a market with its history so far.
+
+        :param rows: (changed_at, one, two, max_limit) tuples oldest first, as returned by Pinnacle.get_odds_history
+        """
+        buffer = RingBuffer(self.capacity)
+        buffer.extend([history_row(*row) for row in rows])
+        self.buffers[market_id] = buffer
+        self.buffers.move_to_end(market_id)
+        while len(self.buffers) > self.max_markets:
+            self.buffers.popitem(last=False)
+            self.evictions += 1
+        return buffer.array()
+
+    def record(self, market_id, changed_at, one=None, two=None, limit=None):
+        """
+        Append a change to a tracked market; changes to untracked markets are left to the database.
+        """
+        buffer = self.buffers.get(market_id)
+        if buffer is not None:
+            buffer.append(history_row(changed_at, one, two, limit))
+
+    def discard(self, market_id):
+        self.buffers.pop(market_id, None)
+
+    def info(self):
+        return {
+            'markets': len(self.buffers),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
@@ -0,0 +1,206 @@
+from bisect import bisect_left
+
+import numpy as np
+from scipy.interpolate import PchipInterpolator
+
+from tools.devig import LRUCache, devig_batch
+from tools.odds import amer_to_dec_array, amer_to_imp_array
+
+
+def unwrap_odds(odds):
+    if isinstance(odds, list):
+        return odds[0]
+    if isinstance(odds, dict):
+        return odds['odds']
+    return odds
+
+
+class LineIndex:
+    """
+    Immutable sorted index over one sharp spread/total ladder.
+
+    Lines are canonical floats regardless of whether the feed keyed them as floats, ints or strings. Alongside the
+    quotes it keeps numpy arrays of the lines, each side's American odds and implied probabilities, and the limits;
+    those are built on first use since most ladders only ever see exact-line lookups.
+    """
+    __slots__ = ('line_list', 'quotes', '_arrays', '_fingerprint')
+
+    def __init__(self, market_data):
+        quotes = {}
+        for key, quote in market_data.items():
+            try:
+                quotes[float(key)] = quote
+            except (TypeError, ValueError):
+                continue
+        self.line_list = sorted(quotes)
+        self.quotes = {line: quotes[line] for line in self.line_list}
+        self._arrays = None
+        self._fingerprint = None
+
+    def _column(self, field):
+        values = [unwrap_odds(self.quotes[line].get(field)) for line in self.line_list]
+        try:
+            return np.array(values, dtype=float)
+        except (TypeError, ValueError):
+            return np.array([np.nan if value is None or value == 'N/A' else float(value) for value in values])
+
+    def _build_arrays(self):
+        one, two = self._column('one'), self._column('two')
+        arrays = {
+            'lines': np.array(self.line_list, dtype=float),
+            'one': one,
+            'two': two,
+            'imp_one': amer_to_imp_array(one),
+            'imp_two': amer_to_imp_array(two),
+            'limits': np.array([self.quotes[line].get('max') for line in self.line_list], dtype=float),
+        }
+        for array in arrays.values():
+            array.flags.writeable = False
+        self._arrays = arrays
+        return arrays
+
+    def _array(name):
+        def get(self):
+            arrays = self._arrays if self._arrays is not None else self._build_arrays()
+            return arrays[name]
+        return property(get)
+
+    lines = _array('lines')
+    one = _array('one')
+    two = _array('two')
+    imp_one = _array('imp_one')
+    imp_two = _array('imp_two')
+    limits = _array('limits')
+    del _array
+
+    @property
+    def fingerprint(self):
+        """
+        The ladder's (line, one, two) contents as a tuple; compared in full when used as a cache key, so two ladders
+        can't share an entry through a hash collision.
+        """
+        if self._fingerprint is None:
+            self._fingerprint = tuple((line, unwrap_odds(quote.get('one')), unwrap_odds(quote.get('two')))
+                                      for line, quote in self.quotes.items())
+        return self._fingerprint
+
+    def __len__(self):
+        return len(self.line_list)
+
+    def __contains__(self, line):
+        return float(line) in self.quotes
+
+    def get(self, line, default=None):
+        return self.quotes.get(float(line), default)
+
+    def nearest(self, line):
+        """
+        Closest line on the ladder, preferring the lower one on ties.
+        """
+        line = float(line)
+        i = bisect_left(self.line_list, line)
+        if i == 0:
+            return self.line_list[0]
+        if i == len(self.line_list):
+            return self.line_list[-1]
+        below, above = self.line_list[i - 1], self.line_list[i]
+        if above - line < line - below:
+            return above
+        return below
+
+    def neighbours(self, line):
+        """
+        Ladder lines directly below and above line (exclusive), None past either end.
+        """
+        line = float(line)
+        i = bisect_left(self.line_list, line)
+        j = i + 1 if i < len(self.line_list) and self.line_list[i] == line else i
+        below = self.line_list[i - 1] if i > 0 else None
+        above = self.line_list[j] if j < len(self.line_list) else None
+        return below, above
+
+    def nearest_array(self, lines):
+        """
+        Vectorized nearest(): positions into self.lines of the closest line for each of lines.
+        """
+        lines = np.asarray(lines, dtype=float)
+        i = np.searchsorted(self.lines, lines, side='left')
+        below = np.clip(i - 1, 0, len(self.lines) - 1)
+        above = np.clip(i, 0, len(self.lines) - 1)
+        take_above = (self.lines[above] - lines) < (lines - self.lines[below])
+        return np.where(take_above, above, below)
+
+
+def isotonic(values, increasing=True):
+    """
+    Pool-adjacent-violators fit: the closest (least squares) monotone sequence to values.
+    """
+    values = np.asarray(values, dtype=float)
+    sign = 1 if increasing else -1
+    blocks = []
+    for value in sign * values:
+        blocks.append([value, 1])
+        while len(blocks) > 1 and blocks[-2][0] > blocks[-1][0]:
+            value, weight = blocks.pop()
+            blocks[-1][0] = (blocks[-1][0] * blocks[-1][1] + value * weight) / (blocks[-1][1] + weight)
+            blocks[-1][1] += weight
+    return sign * np.repeat([b[0] for b in blocks], [b[1] for b in blocks])
+
+
+class LadderCurve:
+    """
+    Monotone fair-probability curve over one sharp ladder, one PCHIP fit per side.
+
+    Each ladder line is devigged with the worst-case method, the per-side fair probabilities are made monotone in the
+    line (isotonic fit) and interpolated with PCHIP, which keeps them monotone between lines. Past either end of the
+    ladder the curve continues linearly with the end slope.
+    """
+    min_prob = 0.001
+    max_prob = 0.999
+
+    def __init__(self, ladder, market):
+        valid = np.isfinite(ladder.one) & np.isfinite(ladder.two)
+        lines = ladder.lines[valid]
+        worst = devig_batch(amer_to_dec_array(np.column_stack([ladder.one[valid], ladder.two[valid]])))[2]
+        probs = 1 / amer_to_dec_array(worst)
+        # Overs lose value as the total rises; the home side gains value as its handicap grows
+        one_increasing = market != 'total'
+        self.sides = {
+            'one': self.fit(lines, probs[:, 0], one_increasing),
+            'two': self.fit(lines, probs[:, 1], not one_increasing),
+        }
+
+    @staticmethod
+    def fit(lines, probs, increasing):
+        interpolator = PchipInterpolator(lines, isotonic(probs, increasing), extrapolate=False)
+        ends = lines[[0, -1]]
+        return interpolator, ends, interpolator(ends), interpolator.derivative()(ends)
+
+    def __call__(self, lines, side):
+        """
+        Fair probabilities of side ('one' or 'two') at each of lines.
+        """
+        interpolator, ends, end_probs, end_slopes = self.sides[side]
+        lines = np.asarray(lines, dtype=float)
+        probs = interpolator(np.clip(lines, ends[0], ends[1]))
+        probs = np.where(lines < ends[0], end_probs[0] + (lines - ends[0]) * end_slopes[0], probs)
+        probs = np.where(lines > ends[1], end_probs[1] + (lines - ends[1]) * end_slopes[1], probs)
+        return np.clip(probs, self.min_prob, self.max_prob)
+
+
+curve_cache = LRUCache(maxsize=4096)
+_missing = object()
+
+
+def get_curve(ladder, market):
+    """
+    Fitted LadderCurve for a ladder, or None when it has fewer than two priced lines. Fits are cached by the ladder's
+    contents, so a curve is reused until the ladder changes.
+    """
+    key = (market, ladder.fingerprint)
+    curve = curve_cache.get(key, _missing)
+    if curve is _missing:
+        priced = np.count_nonzero(np.isfinite(ladder.one) & np.isfinite(ladder.two))
+        curve = LadderCurve(ladder, market) if priced >= 2 else None
+        curve_cache.put(key, curve)
+    return curve
@@ -0,0 +1,129 @@
+import numpy as np
+
+# American odds come from a bounded integer domain, so every conversion out of
+# American is precomputed once and looked up by index. Anything outside the
+# table (non-integral or out of range) falls back to the arithmetic.
+AMER_MIN = -20000
+AMER_MAX = 20000
+
+_amer = np.arange(AMER_MIN, AMER_MAX + 1, dtype=float)
+with np.errstate(divide='ignore', invalid='ignore'):
+    DEC_TABLE = np.where(_amer > 0, (_amer / 100) + 1, (100 / -_amer) + 1)
+    IMP_TABLE = np.where(_amer > 0, 100 / (_amer + 100), -_amer / (-_amer + 100))
+DEC_TABLE[_amer == 0] = np.nan
+IMP_TABLE[_amer == 0] = np.nan
+
+_dec_list = DEC_TABLE.tolist()
+_imp_list = IMP_TABLE.tolist()
+
+
+def _table_index(odds):
+    if type(odds) is int:
+        pass
+    elif isinstance(odds, float) and odds.is_integer():
+        odds = int(odds)
+    else:
+        return None
+    if AMER_MIN <= odds <= AMER_MAX:
+        return odds - AMER_MIN
+    return None
+
+
+def amer_to_dec(odds):
+    """
+    American odds to decimal odds.
+
+    :param odds: American odds (int, float or numeric string)
+    :return: Decimal odds, or None for empty/zero odds
+    """
+    if not odds:
+        return None
+    idx = _table_index(odds)
+    if idx is not None:
+        return _dec_list[idx]
+    odds = float(odds)
+    if odds > 0:
+        return (odds / 100) + 1
+    return (100 / -odds) + 1
+
+
+def amer_to_imp(odds):
+    """
+    American odds to implied probability.
+
+    :param odds: American odds (int, float or numeric string)
+    :return: Implied probability, or None for empty/zero odds
+    """
+    if not odds:
+        return None
+    idx = _table_index(odds)
+    if idx is not None:
+        return _imp_list[idx]
+    odds = float(odds)
+    if odds > 0:
+        return 100 / (odds + 100)
+    return -odds / (-odds + 100)
+
+
+def dec_to_amer(dec):
+    if not dec:
+        return None
+    if dec >= 2:
+        amer = (dec - 1) * 100
+    else:
+        amer = (-100) / (dec - 1)
+    return int(amer)
+
+
+def imp_to_amer(imp):
+    if not imp:
+        return None
+    return dec_to_amer(1 / imp)
+
+
+def _lookup_array(odds, table, fallback):
+    odds = np.asarray(odds, dtype=float)
+    out = np.empty_like(odds)
+    with np.errstate(invalid='ignore'):
+        in_table = (odds >= AMER_MIN) & (odds <= AMER_MAX) & (odds == np.trunc(odds))
+    out[in_table] = table[(odds[in_table] - AMER_MIN).astype(np.intp)]
+    rest = ~in_table
+    if rest.any():
+        with np.errstate(divide='ignore', invalid='ignore'):
+            out[rest] = fallback(odds[rest])
+    return out
+
+
+def amer_to_dec_array(odds):
+    """
+    Array-in/array-out amer_to_dec. Zero odds map to NaN.
+    """
+    return _lookup_array(odds, DEC_TABLE, lambda o: np.where(o > 0, (o / 100) + 1, (100 / -o) + 1))
+
+
+def amer_to_imp_array(odds):
+    """
+    Array-in/array-out amer_to_imp. Zero odds map to NaN.
+    """
+    return _lookup_array(odds, IMP_TABLE, lambda o: np.where(o > 0, 100 / (o + 100), -o / (-o + 100)))
+
+
+def dec_to_amer_array(dec):
+    """
+    Vectorized dec_to_amer, truncating towards zero like int() does.
+
+    :param dec: Array of decimal odds
+    :return: Array of American odds as floats
+    """
+    dec = np.asarray(dec, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        amer = np.where(dec >= 2, (dec - 1) * 100, (-100) / (dec - 1))
+    return np.trunc(amer)
+
+
+def imp_to_amer_array(imp):
+    """
+    Array-in/array-out imp_to_amer.
+    """
+    with np.errstate(divide='ignore'):
+        return dec_to_amer_array(1 / np.asarray(imp, dtype=float))
@@ -0,0 +1,163 @@
+import asyncio
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+
+class WriteBehind:
+    """
+    Write-behind queue in front of an async write(batch, captured_at) coroutine.
+
+    Snapshots are {key: value} dicts submitted with the time they were captured. A writer task drains the bounded
+    queue; whatever has piled up while it was writing is coalesced into one batch (later snapshots win per key, and
+    captured_at maps each key to its own capture time). A full queue is coalesced in place instead of blocking the
+    producer.
+
+    A failed batch is retried every retry_delay seconds. Newer snapshots are merged into it on its first retry only, so
+    a batch that keeps failing can't swallow everything after it; after max_retries failed retries it is logged and
+    dropped, and the writer moves on to what's queued.
+    """
+    def __init__(self, write, maxsize=16, retry_delay=1, max_retries=3):
+        self.write = write
+        self.queue = asyncio.Queue(maxsize)
+        self.retry_delay = retry_delay
+        self.max_retries = max_retries
+        self.task = None
+        # Capture time of the oldest snapshot in each queued item, in queue order
+        self.queued_since = deque()
+        # Batch being written, or kept for retry after a failure: (batch, captured_at, oldest)
+        self.current = None
+        self.failed = False
+        # Failed attempts at the current batch
+        self.attempts = 0
+        self.written = 0
+        self.coalesced = 0
+        self.failures = 0
+        self.retries = 0
+        self.dropped = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+        return self
+
+    def submit(self, snapshot, captured_at=None):
+        if not snapshot:
+            return
+        captured_at = captured_at or datetime.now(timezone.utc)
+        item = (snapshot, dict.fromkeys(snapshot, captured_at), captured_at)
+        if self.queue.full():
+            # Fold everything queued plus the new snapshot into one item, preserving order
+            item = self.merge(self.drain() + [item])
+        self.queue.put_nowait(item)
+        self.queued_since.append(item[2])
+
+    def drain(self):
+        items = []
+        while not self.queue.empty():
+            items.append(self.queue.get_nowait())
+            self.queued_since.popleft()
+        return items
+
+    def merge(self, items, retried=None):
+        """
+        Fold queued items into one, on top of a failed batch being retried if given. Only queued snapshots folded
+        into each other count as coalesced.
+        """
+        if items:
+            self.coalesced += len(items) - 1
+        if retried is not None:
+            items = [retried] + items
+        batch, captured = {}, {}
+        for snapshot, times, _ in items:
+            batch.update(snapshot)
+            captured.update(times)
+        return batch, captured, min(item[2] for item in items)
+
+    async def next_items(self):
+        if not self.failed:
+            items = [await self.queue.get()]
+            self.queued_since.popleft()
+            return items
+        if self.attempts > 1:
+            # Already failed with newer snapshots merged in; retry it alone
+            await asyncio.sleep(self.retry_delay)
+            return []
+        # Retry the failed batch after retry_delay, or as soon as something new arrives
+        try:
+            items = [await asyncio.wait_for(self.queue.get(), self.retry_delay)]
+            self.queued_since.popleft()
+        except asyncio.TimeoutError:
+            items = []
+        return items
+
+    async def run(self):
+        while True:
+            items = await self.next_items()
+            retried = self.current if self.failed else None
+            if retried is not None:
+                self.retries += 1
+            if retried is None or self.attempts == 1:
+                items += self.drain()
+            self.current = self.merge(items, retried)
+            batch, captured, oldest = self.current
+            try:
+                await self.write(batch, captured)
+            except Exception as e:
+                self.failures += 1
+                self.attempts += 1
+                if self.attempts <= self.max_retries:
+                    print(f'Write-behind batch of {len(batch)} failed, retrying: {e}')
+                    self.failed = True
+                    continue
+                print(f'Write-behind batch of {len(batch)} failed {self.attempts} times, dropping it: {e}\n'
+                      f'Dropped keys: {sorted(batch)}')
+                self.dropped += 1
+            else:
+                self.written += len(batch)
+                self.last_lag = (datetime.now(timezone.utc) - oldest).total_seconds()
+                self.max_lag = max(self.max_lag, self.last_lag)
+            self.current = None
+            self.failed = False
+            self.attempts = 0
+
+    def lag(self):
+        """
+        Seconds the oldest unwritten snapshot has been waiting, 0 when everything is written.
+        """
+        oldest = [since for since in (self.current[2] if self.current else None,
+                                      self.queued_since[0] if self.queued_since else None) if since is not None]
+        if not oldest:
+            return 0.0
+        return (datetime.now(timezone.utc) - min(oldest)).total_seconds()
+
+    def info(self):
+        return {
+            'depth': self.queue.qsize(),
+            'lag': round(self.lag(), 3),
+            'last_lag': round(self.last_lag, 3),
+            'max_lag': round(self.max_lag, 3),
+            'written': self.written,
+            'coalesced': self.coalesced,
+            'failures': self.failures,
+            'retries': self.retries,
+            'dropped': self.dropped,
+        }
+
+    async def close(self, timeout=30):
+        """
+        Flush everything queued or in flight (giving up after timeout seconds), then stop the writer.
+        """
+        if self.task is None:
+            return
+        deadline = time.monotonic() + timeout
+        while (not self.queue.empty() or self.current is not None) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
@@ -0,0 +1,160 @@
+import asyncio
+import importlib.util
+import random
+import time
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+import httpx
+
+# HTTP/2 needs the h2 package (httpx[http2]); brotli decoding is picked up by httpx automatically when installed
+http2 = importlib.util.find_spec('h2') is not None
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+
+class RetryBudget:
+    """
+    Token bucket shared by every request: each request earns ratio of a retry, each retry spends one, with a
+    min_per_second floor so a quiet process can still retry. Keeps a failing host from multiplying its own load.
+    """
+    def __init__(self, ratio=0.1, min_per_second=1, ttl=10):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max(min_per_second * ttl, 1)
+        self.tokens = self.max_tokens
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.max_tokens, self.tokens + (now - self.updated) * self.min_per_second)
+        self.updated = now
+
+    def deposit(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self):
+        self.refill()
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class Transport:
+    """
+    Shared async HTTP client: one keep-alive connection pool (HTTP/2 when available), per-host concurrency limits and
+    timeouts, and jittered exponential backoff retries under a global RetryBudget.
+
+    Non-idempotent requests (POST) are only retried when the request can't have reached the server: connection
+    failures and 429s.
+    """
+    def __init__(self, timeout=10, max_connections=100, max_keepalive=20, per_host=10, host_limits=None,
+                 host_timeouts=None, retries=3, backoff=0.25, max_backoff=4, budget=None):
+        self.timeout = timeout
+        self.per_host = per_host
+        self.host_limits = host_limits or {}
+        self.host_timeouts = host_timeouts or {}
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.budget = budget or RetryBudget()
+        self.semaphores = {}
+        self.client = httpx.AsyncClient(
+            http2=http2,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive),
+        )
+
+    def semaphore(self, host):
+        semaphore = self.semaphores.get(host)
+        if semaphore is None:
+            semaphore = self.semaphores[host] = asyncio.Semaphore(self.host_limits.get(host, self.per_host))
+        return semaphore
+
+    def delay(self, attempt, response=None):
+        if response is not None and response.headers.get('Retry-After', '').isdigit():
+            return min(float(response.headers['Retry-After']), self.max_backoff)
+        # Full jitter
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    async def request(self, method, url, **kwargs):
+        method = method.upper()
+        host = urlsplit(str(url)).hostname
+        kwargs.setdefault('timeout', self.host_timeouts.get(host, self.timeout))
+        idempotent = method in IDEMPOTENT_METHODS
+        self.budget.deposit()
+
+        attempt = 0
+        while True:
+            response = None
+            try:
+                async with self.semaphore(host):
+                    response = await self.client.request(method, url, **kwargs)
+                retry = response.status_code == 429 or (idempotent and response.status_code in RETRY_STATUSES)
+                if not retry or attempt >= self.retries or not self.budget.withdraw():
+                    return response
+            except httpx.TransportError as e:
+                retry = idempotent or isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+                if not retry or attempt >= self.retries or not self.budget.withdraw():
+                    raise
+            attempt += 1
+            await asyncio.sleep(self.delay(attempt, response))
+
+    @asynccontextmanager
+    async def stream(self, method, url, **kwargs):
+        """
+        Streaming request(): retries happen before the body is read, then the response is yielded unread and closed
+        on exit. The host's slot is held for as long as the body is being consumed.
+        """
+        method = method.upper()
+        host = urlsplit(str(url)).hostname
+        kwargs.setdefault('timeout', self.host_timeouts.get(host, self.timeout))
+        idempotent = method in IDEMPOTENT_METHODS
+        self.budget.deposit()
+
+        attempt = 0
+        while True:
+            response = None
+            async with self.semaphore(host):
+                try:
+                    response = await self.client.send(self.client.build_request(method, url, **kwargs), stream=True)
+                except httpx.TransportError as e:
+                    retry = idempotent or isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+                    if not retry or attempt >= self.retries or not self.budget.withdraw():
+                        raise
+                else:
+                    retry = response.status_code == 429 or (idempotent and response.status_code in RETRY_STATUSES)
+                    if not retry or attempt >= self.retries or not self.budget.withdraw():
+                        try:
+                            yield response
+                        finally:
+                            await response.aclose()
+                        return
+                    await response.aclose()
+            attempt += 1
+            await asyncio.sleep(self.delay(attempt, response))
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+transport = Transport(
+    host_limits={
+        'pinnacle-odds.p.rapidapi.com': 4,
+        'discord.com': 2,
+        'discordapp.com': 2,
+    },
+    host_timeouts={
+        'pinnacle-odds.p.rapidapi.com': httpx.Timeout(10, connect=5),
+        'discord.com': httpx.Timeout(15, connect=5),
+        'discordapp.com': httpx.Timeout(15, connect=5),
+    },
+)